@@ -1,190 +1,116 @@
-import requests
+from datetime import date
+
 from flask import Flask, render_template, request, redirect, url_for, flash
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload
+
+from config import Config
+from models import db, Book, Job
+import database
+import search_index
+import library_stats
+import reading_log
+import book_queries
+from book_queries import keyset_page, encode_cursor
+from listing_spec import Listing
+import query_plans
+import query_budget
+import backup
+import google_books
+import covers
+import http_cache
+import facets
+import genre_resolver
+import metrics
+import jobs
+import enrichment
 
 app = Flask(__name__)
 
-# Secret key for sessions
-app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-
-# Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///books.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Secret key, database URI and engine profile (pragmas, pool, read replica)
+app.config.from_object(Config)
+database.init_app(app, db)
+metrics.init_app(app, db)  # Request timings, SQL counts and Google Books latency (see /metrics)
 migrate = Migrate(app, db)  # Initialize Flask-Migrate
-
-# --- THE MODEL (Data Structure) ---
-# Association table for many-to-many relationship between Book and Genre
-book_genre = db.Table('book_genre',
-    db.Column('book_id', db.Integer, db.ForeignKey('book.id'), primary_key=True),
-    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True)
-)
-
-class Genre(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), unique=True, nullable=False)
-
-class Book(db.Model):
-   id = db.Column(db.Integer, primary_key=True)
-   title = db.Column(db.String(100), nullable=False)
-   author = db.Column(db.String(100), nullable=False)
-   status = db.Column(db.String(20), default='To Read')
-   # New column for media type (Physical, E-Book, Audiobook)
-   format = db.Column(db.String(20), nullable=False, default='Physical')
-   # New columns for rating and category
-   rating = db.Column(db.Integer, default=0)  # 0-5 stars
-   # Additional features columns
-   total_pages = db.Column(db.Integer, default=0)  # Total pages in the book
-   pages_read = db.Column(db.Integer, default=0)  # Number of pages read
-   notes = db.Column(db.Text, default='')  # Personal notes/reviews for the book
-   start_date = db.Column(db.Date)  # When the user started reading
-   finish_date = db.Column(db.Date)  # When the user finished reading
-   cover_image = db.Column(db.String(200), default='')  # URL or path to book cover
-   # Many-to-many relationship with genres
-   genres = db.relationship('Genre', secondary=book_genre, lazy='subquery',
-                            backref=db.backref('books', lazy=True))
+http_cache.init_app(app)  # Response cache keyed on the library version
+jobs.init_app(app)  # Worker pool of the background job queue
 
 # --- API INTEGRATION FUNCTIONS ---
-def search_google_books(query):
-    """Search for books using Google Books API"""
-    try:
-        # Google Books API endpoint
-        api_url = f"https://www.googleapis.com/books/v1/volumes?q={query}"
-
-        # Make request to the API
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        data = response.json()
-
-        # Process the results
-        results = []
-        if 'items' in data:
-            for item in data['items']:
-                volume_info = item.get('volumeInfo', {})
-
-                # Extract relevant information
-                title = volume_info.get('title', 'Unknown Title')
-                authors = volume_info.get('authors', ['Unknown Author'])
-                description = volume_info.get('description', 'No description available')
-
-                # Get the first author if available
-                author = ', '.join(authors) if authors else 'Unknown Author'
-
-                # Get page count if available
-                page_count = volume_info.get('pageCount', 0)
-
-                # Get cover image URL if available
-                image_links = volume_info.get('imageLinks', {})
-                cover_url = image_links.get('thumbnail', '') or image_links.get('smallThumbnail', '')
-
-                # Get published date if available
-                published_date = volume_info.get('publishedDate', '')
+def search_google_books(query, fields=google_books.VOLUME_FIELDS, start_index=0, limit=None):
+    """Search for books using Google Books API.
 
-                # Get average rating if available
-                average_rating = volume_info.get('averageRating', 0)
-
-                # Get categories if available
-                categories = volume_info.get('categories', [])
-
-                # Get preview URL if available
-                preview_url = volume_info.get('previewLink', '')
-
-                book_info = {
-                    'title': title,
-                    'author': author,
-                    'description': description,
-                    'page_count': page_count,
-                    'cover_url': cover_url,
-                    'published_date': published_date,
-                    'average_rating': average_rating,
-                    'categories': categories,  # Return all categories
-                    'preview_url': preview_url,
-                    'id': item.get('id', '')
-                }
-
-                results.append(book_info)
-
-        return results
+    Returns dictionaries with the requested ``fields``; with a ``limit``
+    larger than one API page, further pages are fetched as needed.
+    """
+    try:
+        # Pooled, cached client with timeouts (see google_books.py)
+        client = google_books.get_client()
+        if limit is None:
+            records = google_books.normalize_volumes(client.search(query, start_index), fields)
+        else:
+            records = client.iter_search(query, fields, start_index, limit)
+        return [record.to_dict() for record in records]
     except Exception as e:
-        print(f"Error searching Google Books API: {e}")
+        app.logger.warning('Error searching Google Books API: %s', e)
         return []
 
+def add_books_from_api(book_infos):
+    """Add looked-up books to the library in one transaction; returns the new Book objects"""
+    # Resolve every category at once instead of one lookup per genre
+    genres = genre_resolver.resolve(category for info in book_infos for category in info['categories'])
+
+    books = []
+    for info in book_infos:
+        book = Book(
+            title=info['title'],
+            author=info['author'],
+            total_pages=info['page_count'] or 0,
+            cover_image=info['cover_url'],
+            notes='' if info['description'] == 'No description available' else info['description'],
+            genres=[genres[name] for name in genre_resolver.clean_names(info['categories'])]
+        )
+        db.session.add(book)
+        books.append(book)
+    db.session.flush()  # Assign ids before recording the statistics
+
+    for book in books:
+        library_stats.record_change(None, library_stats.snapshot(book))
+    http_cache.bump_version()
+    db.session.commit()
+    return books
+
 # --- THE ROUTES (Logic) ---
 
 # 1. READ (Home Page) with search, filtering, and sorting
 @app.route('/')
+@database.read_replica
+@http_cache.cached_view()
 def index():
    # Get filter and search parameters
    search_query = request.args.get('search', '')
    genre_filter = request.args.get('genre', '')
    rating_filter = request.args.get('rating', '')
    format_filter = request.args.get('format', '')
-   sort_by = request.args.get('sort', 'title')  # Default sort by title
-   sort_order = request.args.get('order', 'asc')  # Default ascending order
+   progress_min = request.args.get('progress_min', '')  # Reading progress range in percent
+   progress_max = request.args.get('progress_max', '')
    page = request.args.get('page', 1, type=int)  # Pagination: current page number
    per_page = 12  # Number of books per page
 
-   # Start with base query
-   query = Book.query
+   # Validated filters and sort (default: title, ascending), see listing_spec.py
+   listing = Listing.from_args(request.args, default_order='asc')
+   sort_by, sort_order = listing.sort, listing.order
 
-   # Apply search filter
-   if search_query:
-       query = query.filter(Book.title.contains(search_query) | Book.author.contains(search_query))
+   # Apply pagination (the numbered paginator needs the total, so LIMIT/OFFSET here)
+   books = listing.paginate(page=page, per_page=per_page)
 
-   # Apply genre filter
-   if genre_filter and genre_filter != 'all':
-       query = query.join(Book.genres).filter(Genre.name == genre_filter)
+   # Load More continues from the last book on this page via load_more_books()
+   books.next_cursor = None
+   if books.has_next and books.items:
+       books.next_cursor = encode_cursor(sort_by, sort_order, books.items[-1], page * per_page)
 
-   # Apply rating filter
-   if rating_filter and rating_filter != 'all':
-       try:
-           rating_value = int(rating_filter)
-           query = query.filter(Book.rating == rating_value)
-       except ValueError:
-           pass  # Ignore invalid rating values
-
-   # Apply format filter
-   if format_filter and format_filter != 'all':
-       query = query.filter(Book.format == format_filter)
-
-   # Apply sorting
-   if sort_by == 'title':
-       if sort_order == 'desc':
-           query = query.order_by(Book.title.desc())
-       else:
-           query = query.order_by(Book.title.asc())
-   elif sort_by == 'author':
-       if sort_order == 'desc':
-           query = query.order_by(Book.author.desc())
-       else:
-           query = query.order_by(Book.author.asc())
-   elif sort_by == 'rating':
-       if sort_order == 'desc':
-           query = query.order_by(Book.rating.desc())
-       else:
-           query = query.order_by(Book.rating.asc())
-   elif sort_by == 'date':
-       # Order by ID as a proxy for date added (higher ID = newer)
-       if sort_order == 'desc':
-           query = query.order_by(Book.id.desc())
-       else:
-           query = query.order_by(Book.id.asc())
-   elif sort_by == 'status':
-       # Sort by status (To Read, Reading, Finished)
-       if sort_order == 'desc':
-           query = query.order_by(Book.status.desc())
-       else:
-           query = query.order_by(Book.status.asc())
-
-   # Apply pagination
-   books = query.paginate(page=page, per_page=per_page, error_out=False)
-
-   # Get all unique categories for the filter dropdown
-   all_categories = [genre.name for genre in Genre.query.all()]
-   all_formats = [fmt[0] for fmt in db.session.query(Book.format).distinct().all()]
+   # Genre and format dropdowns with counts under the other filters (cached, see facets.py)
+   listing_facets = facets.listing_facets(search_query, genre_filter, rating_filter, format_filter,
+                                          progress_min, progress_max)
 
    return render_template('index.html',
                          books=books.items,  # Items for the current page
@@ -193,10 +119,29 @@ def index():
                          genre_filter=genre_filter,
                          rating_filter=rating_filter,
                          format_filter=format_filter,
+                         progress_min=progress_min,
+                         progress_max=progress_max,
                          sort_by=sort_by,
                          sort_order=sort_order,
-                         all_categories=all_categories,
-                         all_formats=all_formats)
+                         all_categories=listing_facets.genres,
+                         all_formats=listing_facets.formats)
+
+# 1b. READ (Load More) - next batch of book cards only
+@app.route('/books/more')
+@database.read_replica
+def load_more_books():
+   # Same filter and sort parameters as index(), plus the cursor from the previous batch
+   listing = Listing.from_args(request.args, default_order='asc')
+   cursor = request.args.get('cursor', '')
+   per_page = 12
+
+   # Only the page query runs: no COUNT(*), no dropdown facets, no full page render
+   books = keyset_page(listing, cursor, per_page)
+
+   return {
+       'html': render_template('book_grid_fragment.html', books=books.items),
+       'next_cursor': books.next_cursor
+   }
 
 # 2. CREATE (Add a Book)
 @app.route('/add', methods=['POST'])
@@ -235,19 +180,14 @@ def add_book():
            notes=notes
        )
        db.session.add(new_book)
-       db.session.flush()  # Flush to get the ID before assigning genres
-
-       # Assign genres to the book
-       if genre_names:
-           for genre_name in genre_names:
-               # Check if genre already exists in the database
-               genre = Genre.query.filter_by(name=genre_name).first()
-               if not genre:
-                   # Create new genre if it doesn't exist
-                   genre = Genre(name=genre_name)
-                   db.session.add(genre)
-                   db.session.flush()  # Flush to get the ID
-               new_book.genres.append(genre)
+
+       # Assign genres to the book (resolved together, missing ones created)
+       genre_resolver.set_book_genres(new_book, genre_names)
+       db.session.flush()  # Assign the ID before recording the statistics
+
+       # Update the materialized statistics and invalidate cached pages in the same transaction
+       library_stats.record_change(None, library_stats.snapshot(new_book))
+       http_cache.bump_version()
 
        db.session.commit()
        flash('Book added successfully!', 'success')
@@ -260,7 +200,7 @@ def add_book():
 # 3. UPDATE (Edit a Book)
 @app.route('/update/<int:id>', methods=['GET', 'POST'])
 def update_book(id):
-   book = Book.query.get_or_404(id)
+   book = Book.query.options(selectinload(Book.genres)).get_or_404(id)
    if request.method == 'POST':
        title = request.form['title']
        author = request.form['author']
@@ -275,6 +215,7 @@ def update_book(id):
            return render_template('update.html', book=book)
 
        try:
+           before = library_stats.snapshot(book)
            book.title = title.strip()
            book.author = author.strip()
            book.status = request.form['status']
@@ -285,19 +226,14 @@ def update_book(id):
            book.notes = request.form.get('notes', '')
            book.cover_image = request.form.get('cover_image', '')
 
-           # Update genres
-           genre_names = request.form.getlist('genres')
-           book.genres.clear()  # Remove all current genres
-           if genre_names:
-               for genre_name in genre_names:
-                   # Check if genre already exists in the database
-                   genre = Genre.query.filter_by(name=genre_name).first()
-                   if not genre:
-                       # Create new genre if it doesn't exist
-                       genre = Genre(name=genre_name)
-                       db.session.add(genre)
-                       db.session.flush()  # Flush to get the ID
-                   book.genres.append(genre)
+           # Update genres (only added or removed links are written)
+           genre_resolver.set_book_genres(book, request.form.getlist('genres'))
+
+           db.session.flush()
+           after = library_stats.snapshot(book)
+           library_stats.record_change(before, after)
+           reading_log.record_change(book.id, before, after)  # Written in one batch at commit
+           http_cache.bump_version()
 
            db.session.commit()
            flash('Book updated successfully!', 'success')
@@ -311,157 +247,88 @@ def update_book(id):
 # 4. DELETE (Remove a Book)
 @app.route('/delete/<int:id>')
 def delete_book(id):
-   book = Book.query.get_or_404(id)
+   book = Book.query.options(selectinload(Book.genres)).get_or_404(id)
+   library_stats.record_change(library_stats.snapshot(book), None)
+   http_cache.bump_version()
    db.session.delete(book)
    db.session.commit()
    return redirect(url_for('index'))
 
 # 5. IMPORT/EXPORT (Backup and restore functionality)
 @app.route('/export')
+@database.read_replica
 def export_data():
-   import json
-   books = Book.query.all()
-
-   # Convert books to dictionaries
-   books_data = []
-   for book in books:
-       book_dict = {
-           'title': book.title,
-           'author': book.author,
-           'status': book.status,
-           'format': book.format,
-           'rating': book.rating,
-           'genres': [genre.name for genre in book.genres],
-           'total_pages': book.total_pages,
-           'pages_read': book.pages_read,
-           'notes': book.notes,
-           'cover_image': book.cover_image
-       }
-       books_data.append(book_dict)
-
-   # Create JSON response
-   import io
-   from flask import jsonify
-   json_data = json.dumps(books_data, indent=2, default=str)
-
-   # Return as downloadable file
-   from flask import Response
-   return Response(
-       json_data,
-       mimetype='application/json',
-       headers={'Content-Disposition': 'attachment; filename=shelflog_backup.json'}
-   )
+   # ?format=json|ndjson|csv, ?gzip=1 to compress on the fly
+   export_format = request.args.get('format', 'json')
+   if export_format not in backup.EXPORT_FORMATS:
+       export_format = 'json'
+   compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+   # Streamed in batches, so memory stays bounded and the download starts immediately
+   return backup.export_response(export_format, compress)
+
+@app.route('/import', methods=['POST'])
+def import_data():
+   upload = request.files.get('backup_file')
+   if not upload or not upload.filename:
+       flash('Choose a backup file to import!', 'error')
+       return redirect(url_for('index'))
+
+   # Parsed incrementally and inserted in chunked transactions
+   try:
+       result = backup.import_books(backup.iter_records(upload.stream, upload.filename))
+       flash(f'{result}.', 'success')
+   except backup.BackupImportError as e:
+       flash(f'Error importing backup: {str(e)}', 'error')
+   return redirect(url_for('index'))
+
+# Cover images: served from the local thumbnail cache (see covers.py)
+@app.route('/covers/<int:book_id>')
+def book_cover(book_id):
+   return covers.cover_response(book_id, request.args.get('v', ''))
+
+app.add_template_global(covers.cover_src)
+
+# Prometheus metrics of this process (see metrics.py)
+@app.route('/metrics')
+def metrics_endpoint():
+   return metrics.metrics_response()
 
 # Missing routes for dashboard, search, and export functionality
 @app.route('/dashboard')
+@database.read_replica
+@http_cache.cached_view(extra_key=date.today)  # Rolling windows change daily
 def dashboard():
-    # Calculate statistics for the dashboard
-    total_books = Book.query.count()
-    finished_books = Book.query.filter_by(status='Finished').count()
-    reading_books = Book.query.filter_by(status='Reading').count()
-    to_read_books = Book.query.filter_by(status='To Read').count()
-
-    # Format counts
-    physical_count = Book.query.filter_by(format='Physical').count()
-    ebook_count = Book.query.filter_by(format='E-Book').count()
-    audiobook_count = Book.query.filter_by(format='Audiobook').count()
-
-    # Rating statistics
-    avg_rating = db.session.query(db.func.avg(Book.rating)).scalar() or 0
-    avg_rating = round(avg_rating, 1)
-
-    # Calculate average pages read
-    all_books = Book.query.all()
-    total_pages_read = sum([book.pages_read for book in all_books])
-    total_pages = sum([book.total_pages for book in all_books if book.total_pages > 0])
-
-    progress_percentage = 0
-    if total_pages > 0:
-        progress_percentage = round((total_pages_read / total_pages) * 100, 1)
-
-    # Top categories
-    genre_counts = db.session.query(Genre.name, db.func.count(book_genre.c.book_id)).join(book_genre).group_by(Genre.name).order_by(db.func.count(book_genre.c.book_id).desc()).all()
-    top_categories = genre_counts[:5]  # Top 5 categories
-
-    # Additional statistics
-    high_rated = Book.query.filter(Book.rating >= 4).count()
-
-    # Compile all stats into a dictionary
-    stats = {
-        'total_books': total_books,
-        'finished': finished_books,
-        'reading': reading_books,
-        'to_read': to_read_books,
-        'avg_rating': avg_rating,
-        'progress_percentage': progress_percentage,
-        'physical_count': physical_count,
-        'ebook_count': ebook_count,
-        'audiobook_count': audiobook_count,
-        'top_categories': top_categories,
-        'high_rated': high_rated,
-        'total_pages_read': total_pages_read,
-        # Additional stats that were referenced but not calculated above
-        'books_per_year': 0,
-        'avg_pages_per_book': 0,
-        'avg_days_to_complete': 0,
-        'books_per_month': 0,
-        'completion_rate': 0,
-        'genre_distribution': [],
-        'most_active_month': 'N/A',
-        'peak_reading_season': 'N/A',
-        'preferred_weekday': 'N/A',
-        'books_last_30_days': 0,
-        'current_pace': 0,
-        'consistency_score': 0,
-        'top_categories_labels': [cat[0] for cat in top_categories],
-        'top_categories_counts': [cat[1] for cat in top_categories]
-    }
-
+    # Read the materialized summary tables (falls back to one aggregate pass over book)
+    stats = library_stats.load_dashboard_stats()
+    # Reading activity (streak, pages per day and week) from the reading log rollups
+    stats.update(reading_log.activity_stats())
     return render_template('dashboard.html', stats=stats)
 
 @app.route('/search')
+@database.read_replica
+@http_cache.cached_view()
 def search_books_page():
     # Get search query
     query = request.args.get('q', '').strip()
-    sort_by = request.args.get('sort', 'title')  # Default sort by title
+    # Search title, author, notes and genres; each sort key in its default order (listing_spec.py)
+    listing = Listing(search=query, sort=request.args.get('sort', 'title'))
 
-    # Start with base query
-    base_query = Book.query
-
-    if query:
-        # Search for books by title or author in our database
-        base_query = base_query.filter(
-            Book.title.contains(query) | Book.author.contains(query)
-        )
-
-    # Apply sorting
-    if sort_by == 'title':
-        base_query = base_query.order_by(Book.title.asc())
-    elif sort_by == 'author':
-        base_query = base_query.order_by(Book.author.asc())
-    elif sort_by == 'rating':
-        base_query = base_query.order_by(Book.rating.desc())
-    elif sort_by == 'date':
-        # Order by ID as a proxy for date added (higher ID = newer)
-        base_query = base_query.order_by(Book.id.desc())
-    elif sort_by == 'status':
-        # Sort by status (To Read, Reading, Finished)
-        base_query = base_query.order_by(Book.status.asc())
-
-    search_results = base_query.all()
+    # Search results show a notes snippet but no genres
+    search_results = listing.fetch('all', loader='results')
 
     # Since the template expects all_books to be available, pass an empty list
     # and the search query for the search form to be pre-filled
-    all_categories = [genre.name for genre in Genre.query.all()]
-    all_formats = [fmt[0] for fmt in db.session.query(Book.format).distinct().all()]
+    listing_facets = facets.listing_facets()
 
     return render_template('search_results.html',
                            books=search_results,
                            search_query=query,
-                           all_categories=all_categories,
-                           all_formats=all_formats)
+                           all_categories=listing_facets.genre_names,
+                           all_formats=listing_facets.format_names)
 
 @app.route('/export_data')
+@database.read_replica
 def export_full_books_data():
     # This is the same as the export endpoint, providing an alternative name
     return export_data()
@@ -471,10 +338,16 @@ def export_full_books_data():
 @app.route('/api/search')
 def api_search():
     query = request.args.get('q', '').strip()
+    # Optional projection (?fields=title,author,cover_url) and paging (?start=0&limit=20)
+    fields = google_books.parse_fields(request.args.get('fields'))
+    start_index = request.args.get('start', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(0, min(limit, google_books.MAX_SEARCH_RESULTS))
 
     if query:
         # Search Google Books API
-        results = search_google_books(query)
+        results = search_google_books(query, fields, max(start_index, 0), limit)
         return {'books': results}
     else:
         return {'books': []}
@@ -483,70 +356,106 @@ def api_search():
 @app.route('/api/search/isbn')
 def api_search_isbn():
     isbn = request.args.get('isbn', '').strip()
+    fields = google_books.parse_fields(request.args.get('fields'))
 
     if isbn:
-        # Search Google Books API by ISBN
-        api_url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-
+        # Search Google Books API by ISBN (cached by normalized ISBN-13)
         try:
-            response = requests.get(api_url)
-            response.raise_for_status()
-            data = response.json()
-
-            results = []
-            if 'items' in data:
-                for item in data['items']:
-                    volume_info = item.get('volumeInfo', {})
-
-                    # Extract relevant information
-                    title = volume_info.get('title', 'Unknown Title')
-                    authors = volume_info.get('authors', ['Unknown Author'])
-                    description = volume_info.get('description', 'No description available')
-
-                    # Get the first author if available
-                    author = ', '.join(authors) if authors else 'Unknown Author'
-
-                    # Get page count if available
-                    page_count = volume_info.get('pageCount', 0)
-
-                    # Get cover image URL if available
-                    image_links = volume_info.get('imageLinks', {})
-                    cover_url = image_links.get('thumbnail', '') or image_links.get('smallThumbnail', '')
-
-                    # Get published date if available
-                    published_date = volume_info.get('publishedDate', '')
-
-                    # Get average rating if available
-                    average_rating = volume_info.get('averageRating', 0)
-
-                    # Get categories if available
-                    categories = volume_info.get('categories', [])
-
-                    # Get preview URL if available
-                    preview_url = volume_info.get('previewLink', '')
-
-                    book_info = {
-                        'title': title,
-                        'author': author,
-                        'description': description,
-                        'page_count': page_count,
-                        'cover_url': cover_url,
-                        'published_date': published_date,
-                        'average_rating': average_rating,
-                        'categories': categories,  # Return all categories
-                        'preview_url': preview_url,
-                        'id': item.get('id', '')
-                    }
-
-                    results.append(book_info)
-
-            return {'books': results}
+            data = google_books.get_client().lookup_isbn(isbn)
+            return {'books': [record.to_dict() for record in google_books.normalize_volumes(data, fields)]}
         except Exception as e:
-            print(f"Error searching Google Books API by ISBN: {e}")
+            app.logger.warning('Error searching Google Books API by ISBN: %s', e)
             return {'books': []}
     else:
         return {'books': []}
 
+# API route for looking up a whole box of ISBNs at once
+@app.route('/api/search/isbn/batch', methods=['POST'])
+def api_search_isbn_batch():
+    # JSON body {"isbns": [...], "insert": true} or form fields isbns (any separator) and insert
+    payload = request.get_json(silent=True)
+    if payload is None:
+        isbns = request.form.get('isbns', '').replace(',', ' ').split()
+        insert = request.form.get('insert', '').lower() in ('1', 'true', 'yes', 'on')
+    elif not isinstance(payload, dict):
+        return {'error': 'Expected a JSON object'}, 400
+    else:
+        isbns = payload.get('isbns') or []
+        insert = payload.get('insert')
+        if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+            return {'error': 'isbns must be a list of strings'}, 400
+
+    isbns = [isbn.strip() for isbn in isbns if isbn.strip()]
+    if len(isbns) > google_books.MAX_BATCH_SIZE:
+        return {'error': f'At most {google_books.MAX_BATCH_SIZE} ISBNs per request'}, 400
+
+    # Cached ISBNs are answered directly, the rest are fetched concurrently
+    responses = google_books.get_client().lookup_isbns(isbns)
+
+    results = []
+    matches = {}
+    for isbn in isbns:
+        response = responses[isbn]
+        if isinstance(response, Exception):
+            results.append({'isbn': isbn, 'book': None, 'error': 'Lookup failed'})
+            continue
+        items = response.get('items', [])
+        book = google_books.VolumeRecord(items[0]).to_dict() if items else None
+        results.append({'isbn': isbn, 'book': book})
+        if book:
+            # The same book scanned twice (or as ISBN-10 and -13) is added once
+            matches.setdefault(google_books.normalize_isbn(isbn) or isbn, book)
+
+    inserted = 0
+    if insert and matches:
+        try:
+            inserted = len(add_books_from_api(list(matches.values())))
+        except Exception as e:
+            db.session.rollback()
+            return {'error': f'Error adding books: {str(e)}', 'results': results}, 500
+
+    return {
+        'results': results,
+        'found': sum(1 for result in results if result['book']),
+        'inserted': inserted
+    }
+
+# Background jobs: queue a Google Books enrichment, then poll its status (see jobs.py)
+@app.route('/jobs/enrich', methods=['POST'])
+def enqueue_enrichment():
+    # JSON body {"fields": [...], "book_ids": [...]} or form fields of the same names; all fields by default
+    payload = request.get_json(silent=True) or {}
+    fields = payload.get('fields') if payload else request.form.getlist('fields')
+    book_ids = payload.get('book_ids') if payload else request.form.getlist('book_ids')
+    try:
+        params = {'fields': enrichment.parse_fields(fields)}
+        if book_ids:
+            params['book_ids'] = [int(book_id) for book_id in book_ids]
+    except (TypeError, ValueError) as e:
+        return {'error': str(e)}, 400
+    if not jobs.is_available():
+        return {'error': 'Background jobs are not set up; run "flask db upgrade"'}, 503
+
+    job = jobs.enqueue(enrichment.KIND, params)
+    url = url_for('job_status', id=job.id)
+    return {**jobs.describe(job), 'url': url}, 202, {'Location': url}
+
+@app.route('/jobs/<int:id>')
+def job_status(id):
+    return jobs.describe(db.get_or_404(Job, id))
+
+# Register CLI commands (flask search rebuild, flask stats rebuild, flask plans check, flask budget check,
+# flask pagination check, flask import, flask covers prefetch, flask jobs work)
+app.cli.add_command(search_index.search_cli)
+app.cli.add_command(library_stats.stats_cli)
+app.cli.add_command(reading_log.reading_cli)
+app.cli.add_command(query_plans.plans_cli)
+app.cli.add_command(query_budget.budget_cli)
+app.cli.add_command(book_queries.pagination_cli)
+app.cli.add_command(backup.import_command)
+app.cli.add_command(covers.covers_cli)
+app.cli.add_command(jobs.jobs_cli)
+
 # Make the Book model importable
 __all__ = ['Book']
 
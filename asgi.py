@@ -0,0 +1,139 @@
+"""
+ASGI serving mode: ``uvicorn asgi:application --workers 4``.
+
+Under synchronous workers every ``/api/search`` or ``/api/search/isbn``
+request holds a worker for as long as Google Books takes to answer, so a
+few slow upstream calls can starve ``/`` and ``/dashboard``. Here those two
+routes are served natively on the event loop by ``AsyncGoogleBooksClient``
+(httpx), where waiting on the upstream costs no thread. Every other route
+is the unchanged Flask app, run through asgiref's WSGI adapter on a pool of
+ASGI_THREADS threads that only local work (templates, SQLite) ever occupies.
+
+Database access stays synchronous: SQLite has no asynchronous driver worth
+the complexity, and the upstream routes do not touch the database.
+``python -m loadtest`` compares both modes with an artificially slow upstream.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import MultiDict
+
+import google_books
+import metrics
+from google_books_async import AsyncGoogleBooksClient
+from app import app
+
+# Threads running the Flask (WSGI) routes
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # The stock adapter runs every request on one shared thread (thread_sensitive=True)
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi running requests concurrently on the event loop's default executor"""
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+class AsyncApp:
+    """ASGI application: async Google Books routes in front of the Flask app"""
+
+    def __init__(self, flask_app, threads=ASGI_THREADS):
+        self.flask_app = flask_app
+        self.wsgi = PooledWsgiToAsgi(flask_app)
+        self.threads = threads
+        self.client = None
+        self.routes = {
+            '/api/search': self.api_search,
+            '/api/search/isbn': self.api_search_isbn,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        handler = self.routes.get(scope.get('path')) if scope['type'] == 'http' else None
+        if handler is None or scope['method'] != 'GET':
+            return await self.wsgi(scope, receive, send)
+        started = time.perf_counter()
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        await self.send_json(send, await handler(args))
+        metrics.observe_request(scope['path'], 'GET', 200, time.perf_counter() - started)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # The Flask routes run on the loop's default executor
+                asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.threads))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def get_client(self):
+        if self.client is None:
+            with self.flask_app.app_context():
+                self.client = AsyncGoogleBooksClient(google_books.get_client())
+        return self.client
+
+    @staticmethod
+    async def send_json(send, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    # --- ROUTES (same parameters and responses as the Flask views in app.py) ---
+
+    async def api_search(self, args):
+        query = args.get('q', '').strip()
+        fields = google_books.parse_fields(args.get('fields'))
+        start_index = max(args.get('start', 0, type=int), 0)
+        limit = args.get('limit', type=int)
+        if limit is not None:
+            limit = max(0, min(limit, google_books.MAX_SEARCH_RESULTS))
+        if not query:
+            return {'books': []}
+
+        client = self.get_client()
+        try:
+            if limit is None:
+                records = google_books.normalize_volumes(await client.search(query, start_index), fields)
+            else:
+                records = await client.search_records(query, fields, start_index, limit)
+        except Exception as e:
+            self.flask_app.logger.warning('Error searching Google Books API: %s', e)
+            return {'books': []}
+        return {'books': [record.to_dict() for record in records]}
+
+    async def api_search_isbn(self, args):
+        isbn = args.get('isbn', '').strip()
+        fields = google_books.parse_fields(args.get('fields'))
+        if not isbn:
+            return {'books': []}
+
+        try:
+            data = await self.get_client().lookup_isbn(isbn)
+        except Exception as e:
+            self.flask_app.logger.warning('Error searching Google Books API by ISBN: %s', e)
+            return {'books': []}
+        return {'books': [record.to_dict() for record in google_books.normalize_volumes(data, fields)]}
+
+
+application = AsyncApp(app)
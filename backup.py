@@ -0,0 +1,430 @@
+"""
+Backup export for the library.
+
+Exports are streamed: books are read in batches of EXPORT_BATCH_SIZE rows
+with ``yield_per`` (column values only, genres fetched with one query per
+batch), serialized one element at a time and sent as soon as a buffer fills
+up, optionally gzip-compressed on the fly. Memory use is bounded by one batch
+no matter how large the library is, and the download starts immediately.
+
+Supported formats are the original JSON array, NDJSON (one book per line)
+and CSV (genres joined with GENRE_SEPARATOR).
+
+Imports restore any of those formats (optionally gzipped). The file is
+parsed incrementally, genres are resolved once per chunk of
+IMPORT_CHUNK_SIZE books with ``IN`` queries and a batched insert of the
+missing names, and books and their genre links go in with executemany-style
+Core inserts, one transaction per chunk. The search index is updated with
+one statement per chunk rather than by the per-row triggers.
+"""
+
+import csv
+import gzip
+import io
+import json
+import time
+import zlib
+from collections import defaultdict
+from datetime import date
+
+import click
+from flask import Response, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy.exc import StatementError
+
+from models import db, Book, Genre, book_genre
+import library_stats
+import search_index
+import http_cache
+import facets
+import genre_resolver
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = 1000
+# Bytes of serialized output collected before a chunk is sent
+STREAM_BUFFER_SIZE = 64 * 1024
+# Separator for genre names in the CSV genres column
+GENRE_SEPARATOR = '|'
+
+# Books inserted per transaction by the importer
+IMPORT_CHUNK_SIZE = 5000
+# Characters read from the backup file at a time
+READ_SIZE = 64 * 1024
+
+EXPORT_FIELDS = ('title', 'author', 'status', 'format', 'rating', 'genres', 'total_pages',
+                 'pages_read', 'notes', 'cover_image', 'start_date', 'finish_date')
+
+# Book columns written by the importer, in parameter order
+IMPORT_COLUMNS = ('title', 'author', 'status', 'format', 'rating', 'total_pages', 'pages_read',
+                  'notes', 'cover_image', 'start_date', 'finish_date')
+# Record fields copied to the row without conversion
+TEXT_FIELDS = ('title', 'author', 'status', 'format', 'notes', 'cover_image')
+BOOK_INSERT_SQL = (f"INSERT INTO book ({', '.join(IMPORT_COLUMNS)}) "
+                   f"VALUES ({', '.join('?' * len(IMPORT_COLUMNS))})")
+LINK_INSERT_SQL = "INSERT INTO book_genre (book_id, genre_id) VALUES (?, ?)"
+
+EXPORT_FORMATS = {
+    # format: (mimetype, file extension)
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def iter_books(batch_size=EXPORT_BATCH_SIZE):
+    """Yield every book as a dictionary of EXPORT_FIELDS, in id order"""
+    columns = [Book.id] + [getattr(Book, field) for field in EXPORT_FIELDS if field != 'genres']
+    result = db.session.execute(
+        db.select(*columns).order_by(Book.id).execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        # One genre query per batch instead of one per book
+        genres = defaultdict(list)
+        book_ids = [row.id for row in rows]
+        genre_rows = db.session.execute(
+            db.select(book_genre.c.book_id, Genre.name)
+            .join(Genre, Genre.id == book_genre.c.genre_id)
+            .where(book_genre.c.book_id.in_(book_ids))
+        )
+        for book_id, name in genre_rows:
+            genres[book_id].append(name)
+
+        for row in rows:
+            book = row._asdict()
+            book['genres'] = genres.get(book.pop('id'), [])
+            for field in ('start_date', 'finish_date'):
+                if book[field] is not None:
+                    book[field] = book[field].isoformat()
+            yield {field: book[field] for field in EXPORT_FIELDS}
+
+
+def json_chunks(books):
+    """Serialize books as a pretty-printed JSON array, one element at a time"""
+    yield '['
+    separator = '\n'
+    for book in books:
+        yield separator + '  ' + json.dumps(book, indent=2, default=str).replace('\n', '\n  ')
+        separator = ',\n'
+    yield '\n]\n'
+
+
+def ndjson_chunks(books):
+    """Serialize books as newline-delimited JSON"""
+    for book in books:
+        yield json.dumps(book, default=str) + '\n'
+
+
+def csv_chunks(books):
+    """Serialize books as CSV with a header row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for book in books:
+        book['genres'] = GENRE_SEPARATOR.join(book['genres'])
+        writer.writerow([book[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+SERIALIZERS = {
+    'json': json_chunks,
+    'ndjson': ndjson_chunks,
+    'csv': csv_chunks,
+}
+
+
+def encode_stream(chunks, compress=False):
+    """Encode text chunks to UTF-8 bytes in STREAM_BUFFER_SIZE pieces, optionally gzipped"""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= STREAM_BUFFER_SIZE:
+            data = ''.join(pending).encode('utf-8')
+            pending, pending_size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_response(export_format='json', compress=False):
+    """Streaming download of the whole library in the requested format"""
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f'shelflog_backup.{extension}'
+    if compress:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+
+    chunks = SERIALIZERS[export_format](iter_books())
+    return Response(
+        stream_with_context(encode_stream(chunks, compress)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+# --- IMPORT ---
+
+class BackupImportError(Exception):
+    """An import stopped early; ``result`` counts the books committed before the error"""
+
+    def __init__(self, message, result):
+        super().__init__(f'{message} ({result.imported} books imported before the error)')
+        self.result = result
+
+
+# Malformed files (bad JSON or CSV, broken gzip), values the database rejects
+# and concurrent-insert conflicts
+IMPORT_ERRORS = (ValueError, OverflowError, csv.Error, EOFError, zlib.error, gzip.BadGzipFile, RuntimeError,
+                 StatementError)
+
+
+class ImportResult:
+    """Counters reported after an import"""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f'Imported {self.imported} books ({self.skipped} skipped) in {self.seconds:.1f}s '
+                f'({self.rows_per_second:,.0f} rows/s)')
+
+
+def iter_json_array(stream):
+    """Yield the elements of a JSON array without loading the whole document"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = stream.read(READ_SIZE)
+        eof = not data
+        buffer, pos = buffer[pos:] + data, 0
+
+    def skip(characters):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in characters:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip(' \t\r\n')
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError('Backup file is not a JSON array')
+    pos += 1
+    while True:
+        skip(' \t\r\n,')
+        if pos >= len(buffer):
+            raise ValueError('Unexpected end of JSON backup file')
+        if buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()  # Element continues past the buffer
+            continue
+        pos = end
+        yield item
+
+
+def iter_records(fileobj, filename=''):
+    """Yield book dictionaries from a JSON, NDJSON or CSV backup (plain or gzipped)"""
+    raw = fileobj if hasattr(fileobj, 'peek') else io.BufferedReader(fileobj)
+    if raw.peek(2)[:2] == b'\x1f\x8b':
+        raw = io.BufferedReader(gzip.GzipFile(fileobj=raw))
+    name = filename.lower().removesuffix('.gz')
+
+    head = raw.peek(READ_SIZE).lstrip()
+    if head.startswith(b'\xef\xbb\xbf'):
+        head = head[3:].lstrip()
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+    if name.endswith('.csv') or head[:1] not in (b'[', b'{'):
+        for row in csv.DictReader(text):
+            row['genres'] = [genre for genre in (row.get('genres') or '').split(GENRE_SEPARATOR) if genre]
+            yield row
+    elif head[:1] == b'[':
+        yield from iter_json_array(text)
+    else:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _as_int(value):
+    try:
+        return int(value) if value not in (None, '') else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def _as_date(value):
+    """ISO date string (the format dates are stored in), or None"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def _book_row(record):
+    """IMPORT_COLUMNS values for one backup record, or None when it is unusable"""
+    if not isinstance(record, dict):
+        return None
+    # Text columns are stored as given, so they must be scalars
+    if any(isinstance(record.get(field), (dict, list)) for field in TEXT_FIELDS):
+        return None
+    title = str(record.get('title') or '').strip()
+    author = str(record.get('author') or '').strip()
+    if not title or not author:
+        return None
+    return (
+        title,
+        author,
+        record.get('status') or 'To Read',
+        record.get('format') or 'Physical',
+        _as_int(record.get('rating')),
+        _as_int(record.get('total_pages')),
+        _as_int(record.get('pages_read')),
+        record.get('notes') or '',
+        record.get('cover_image') or '',
+        _as_date(record.get('start_date')),
+        _as_date(record.get('finish_date')),
+    )
+
+
+def _insert_books(connection, rows):
+    """Insert IMPORT_COLUMNS tuples; returns the new ids in insertion order"""
+    if connection.dialect.name == 'postgresql':
+        # Other writers wait until this chunk commits, so its ids form one range
+        # (the statistics and search index are updated by id range)
+        connection.exec_driver_sql("LOCK TABLE book IN SHARE ROW EXCLUSIVE MODE")
+        params = [dict(zip(IMPORT_COLUMNS, row)) for row in rows]
+        for values in params:
+            for key in ('start_date', 'finish_date'):
+                if values[key]:
+                    values[key] = date.fromisoformat(values[key])
+        stmt = db.insert(Book.__table__).returning(Book.id, sort_by_parameter_order=True)
+        # Batched into multi-row VALUES statements by SQLAlchemy's insertmanyvalues
+        return connection.execute(stmt, params).scalars().all()
+
+    # Plain driver executemany with tuples: RETURNING with a guaranteed order would
+    # insert row by row on SQLite, and per-row parameter processing dominates at
+    # this volume. New rowids are allocated above the previous maximum, in insertion order.
+    previous_max = connection.execute(db.select(db.func.max(Book.id))).scalar() or 0
+    connection.exec_driver_sql(BOOK_INSERT_SQL, rows)
+    book_ids = connection.execute(
+        db.select(Book.id).where(Book.id > previous_max).order_by(Book.id)
+    ).scalars().all()
+    if len(book_ids) != len(rows):
+        raise RuntimeError('Books were added concurrently during the import; please retry.')
+    return book_ids
+
+
+def _insert_links(connection, links):
+    """Insert (book_id, genre_id) tuples into book_genre"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(book_genre.insert(), [{'book_id': book_id, 'genre_id': genre_id} for book_id, genre_id in links])
+    else:
+        connection.exec_driver_sql(LINK_INSERT_SQL, links)
+
+
+def _import_chunk(records, genre_cache, result):
+    """Insert one chunk of records in a single transaction"""
+    rows, genre_lists = [], []
+    for record in records:
+        row = _book_row(record)
+        if row is None:
+            result.skipped += 1
+            continue
+        genres = record.get('genres') or []
+        if isinstance(genres, str):
+            genres = [genres]
+        elif not isinstance(genres, list):
+            genres = []
+        rows.append(row)
+        genre_lists.append(genre_resolver.clean_names(str(name) for name in genres))
+    if not rows:
+        return
+
+    try:
+        genre_resolver.resolve_ids({name for names in genre_lists for name in names}, genre_cache)
+
+        connection = db.session.connection()
+        with search_index.bulk_insert() as indexed_ids:
+            book_ids = _insert_books(connection, rows)
+            links = [(book_id, genre_cache[name]) for book_id, names in zip(book_ids, genre_lists) for name in names]
+            if links:
+                _insert_links(connection, links)
+            indexed_ids.extend(book_ids)
+
+        library_stats.record_new_books(book_ids[0], book_ids[-1])
+        http_cache.bump_version()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    facets.invalidate()  # Core inserts do not trigger the ORM events
+    result.imported += len(rows)
+
+
+def import_books(records, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Bulk-insert book records, committing every ``chunk_size`` books.
+
+    ``progress`` is called with the ImportResult after each chunk. Earlier
+    chunks stay committed when a later one fails; the BackupImportError
+    raised then says how many.
+    """
+    result = ImportResult()
+    genre_cache = {}
+    started = time.perf_counter()
+    chunk = []
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                _import_chunk(chunk, genre_cache, result)
+                chunk = []
+                result.seconds = time.perf_counter() - started
+                if progress:
+                    progress(result)
+        _import_chunk(chunk, genre_cache, result)
+    except IMPORT_ERRORS as e:
+        raise BackupImportError(str(e), result) from e
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+@click.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Books per transaction.')
+@with_appcontext
+def import_command(path, chunk_size):
+    """Restore books from a JSON, NDJSON or CSV backup (optionally .gz)."""
+    with open(path, 'rb') as backup_file:
+        try:
+            result = import_books(iter_records(backup_file, path), chunk_size,
+                                  progress=lambda partial: click.echo(f'... {partial}'))
+        except BackupImportError as e:
+            raise click.ClickException(str(e))
+    click.echo(str(result))
@@ -0,0 +1,15 @@
+"""
+Reproducible benchmarks of the main routes on synthetic libraries.
+
+    python -m benchmarks generate --size 100k
+    python -m benchmarks run --size 100k --save benchmarks/results/before.json
+    python -m benchmarks run --size 100k --compare benchmarks/results/before.json
+
+``generate`` builds a library of 1k, 100k or 1m books (see library.py)
+through the bulk importer; ``run`` drives the listing with every filter and
+sort, search, the dashboard, the exports, adding and updating books and the
+Google Books routes (served by the local stub in upstream.py) through the
+Flask test client. It reports p50/p99 latency, SQL statements per request
+and peak RSS per case (runner.py), saves them as JSON and, given an earlier
+run with ``--compare``, fails on regressions.
+"""
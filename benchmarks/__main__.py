@@ -0,0 +1,159 @@
+"""
+Command line of the benchmark suite (``python -m benchmarks --help``).
+
+Both commands work on a separate SQLite database per size and seed under
+``benchmarks/data/``; the configured library is never touched. ``run``
+benchmarks a temporary copy, so the books it adds and edits do not leak
+into the next run.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import click
+
+from benchmarks import library, upstream
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+DATA_DIR = PACKAGE_DIR / 'data'
+RESULTS_DIR = PACKAGE_DIR / 'results'
+MIGRATIONS_DIR = PACKAGE_DIR.parent / 'migrations'
+
+REPEAT = 10
+
+
+def library_path(size, seed):
+    return DATA_DIR / f'library-{size}-seed{seed}.db'
+
+
+def load_app(database_path, upstream_url=None):
+    """The Flask app on ``database_path`` (configuration is read when app.py is imported)"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ.pop('DATABASE_REPLICA_URL', None)
+    os.environ.pop('GOOGLE_BOOKS_CACHE_DB', None)
+    if upstream_url:
+        os.environ['GOOGLE_BOOKS_API_URL'] = upstream_url
+    from app import app
+    return app
+
+
+def generate_library(size, seed, force=False):
+    """Create the synthetic library for ``size`` and ``seed`` unless it exists"""
+    path = library_path(size, seed)
+    if path.exists() and not force:
+        return path
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    for leftover in (path, Path(f'{path}-wal'), Path(f'{path}-shm')):
+        leftover.unlink(missing_ok=True)
+
+    from flask_migrate import upgrade
+    from backup import import_books
+    from models import db
+
+    app = load_app(path)
+    with app.app_context():
+        upgrade(directory=str(MIGRATIONS_DIR))
+        count = library.parse_size(size)
+        click.echo(f'Generating {count} books into {path}')
+        result = import_books(library.generate_records(count, seed),
+                              progress=lambda partial: click.echo(f'... {partial}'))
+        click.echo(str(result))
+        # Fold the WAL into the database file so a plain file copy is complete
+        db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        _close_engines()
+    return path
+
+
+def _close_engines():
+    """Close the pooled connections so the temporary database can be removed"""
+    from models import db
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+
+
+@click.group()
+def cli():
+    """Benchmarks of the main routes on synthetic libraries."""
+
+
+@cli.command('generate')
+@click.option('--size', default='1k', show_default=True, help='1k, 100k, 1m or a number of books.')
+@click.option('--seed', default=0, show_default=True, help='Random seed of the library.')
+@click.option('--force', is_flag=True, help='Replace an existing library of this size and seed.')
+def generate_command(size, seed, force):
+    """Create a synthetic library (once per size and seed)."""
+    path = generate_library(size, seed, force)
+    click.echo(f'Library ready: {path}')
+
+
+@cli.command('run')
+@click.option('--size', default='1k', show_default=True, help='1k, 100k, 1m or a number of books.')
+@click.option('--seed', default=0, show_default=True, help='Random seed of the library.')
+@click.option('--repeat', default=REPEAT, show_default=True, help='Timed requests per case.')
+@click.option('--only', default='', help='Comma-separated groups: index, search, dashboard, export, write, api.')
+@click.option('--save', 'save_path', type=click.Path(dir_okay=False),
+              help='Where to write the JSON results (default: benchmarks/results/<size>-<time>.json).')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Earlier results to check for regressions.')
+@click.option('--threshold', default=20, show_default=True, help='Slowdown in percent counted as a regression.')
+def run_command(size, seed, repeat, only, save_path, baseline_path, threshold):
+    """Time every case, save the results and compare them with a baseline."""
+    from benchmarks import runner
+
+    source = library_path(size, seed)
+    if not source.exists():
+        # In its own process: app.py reads the database URL once, when it is imported
+        subprocess.run([sys.executable, '-m', 'benchmarks', 'generate', '--size', size, '--seed', str(seed)],
+                       cwd=PACKAGE_DIR.parent, check=True)
+    stub = upstream.start()
+    with tempfile.TemporaryDirectory(prefix='shelflog-bench-') as workdir:
+        database_path = Path(workdir) / source.name
+        shutil.copyfile(source, database_path)
+        app = load_app(database_path, stub.url)
+        # Measure the views themselves, not the response cache
+        app.config.update(VIEW_CACHE=False, SERVER_TIMING=False, TESTING=True)
+
+        with app.app_context():
+            profile = runner.library_profile()
+            cases = runner.build_cases(profile)
+            groups = {group.strip() for group in only.split(',') if group.strip()}
+            if groups:
+                cases = [case for case in cases if case.group in groups]
+
+            baseline = runner.load(baseline_path) if baseline_path else None
+            baseline_cases = baseline['cases'] if baseline else {}
+            click.echo(f"{profile['books']} books, {len(cases)} cases, {repeat} timed requests each")
+            click.echo(runner.REPORT_HEADER + (f" {'vs base':>8}" if baseline else ''))
+            try:
+                results = runner.run_cases(app, cases, repeat, progress=lambda name, result: click.echo(
+                    runner.format_result(name, result, baseline_cases.get(name))))
+            except runner.BenchmarkError as e:
+                raise click.ClickException(str(e))
+            finally:
+                stub.shutdown()
+                _close_engines()
+
+            metadata = runner.run_metadata(size, seed, repeat, profile)
+
+    save_path = Path(save_path) if save_path else RESULTS_DIR / f"{size}-{metadata['created'][:19].replace(':', '')}.json"
+    runner.save(save_path, metadata, results)
+    click.echo(f'Results saved to {save_path}')
+
+    if baseline:
+        if baseline['meta'].get('books') != metadata['books']:
+            click.echo(f"Note: the baseline ran on {baseline['meta'].get('books')} books, this run on {metadata['books']}.")
+        regressions = runner.compare(results, baseline_cases, threshold / 100)
+        for name, metric, old, new in regressions:
+            click.echo(f'REGRESSION {name}: {metric} {old} -> {new}')
+        if regressions:
+            raise click.ClickException(f'{len(regressions)} regression(s) against {baseline_path}.')
+        click.echo(f'No regressions against {baseline_path}.')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,140 @@
+"""
+Synthetic libraries for the benchmarks.
+
+``generate_records(count, seed)`` yields backup records (the dictionaries
+``backup.import_books()`` restores) with skewed, roughly realistic
+distributions, the same for the same seed:
+
+- authors follow a Zipf-like popularity curve: a few prolific authors own
+  long runs of books, most appear once or twice;
+- genres are skewed the same way (Fiction and Fantasy are common, Poetry
+  rare) and a book has one to three of them;
+- titles are built from a small vocabulary, so the common words of the
+  search benchmarks match thousands of books at the larger sizes;
+- about 60% of books are unread, 10% in progress and 30% finished, with
+  start and finish dates spread over the last six years and ratings on the
+  finished books leaning towards 4 stars;
+- a third of the books carry notes.
+"""
+
+import random
+from datetime import date, timedelta
+from itertools import accumulate
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Alice', 'Amara', 'Anna', 'Arjun', 'Beatrix', 'Carlos', 'Chen', 'Chloe', 'Daniel',
+    'Dmitri', 'Elena', 'Emil', 'Fatima', 'Felix', 'Grace', 'Hannah', 'Haruki', 'Ines', 'Isaac', 'Jamal',
+    'Jane', 'Javier', 'Johan', 'Julia', 'Kenji', 'Lara', 'Leo', 'Lucia', 'Maya', 'Mei', 'Miguel',
+    'Nadia', 'Nikolai', 'Noor', 'Olga', 'Omar', 'Priya', 'Rafael', 'Rosa', 'Samuel', 'Sofia', 'Tariq',
+    'Ursula', 'Victor', 'Wen', 'Yara', 'Yusuf', 'Zadie',
+)
+LAST_NAMES = (
+    'Abbott', 'Achebe', 'Baker', 'Bell', 'Borges', 'Brandt', 'Calvino', 'Carter', 'Castro', 'Chen',
+    'Clarke', 'Dumas', 'Eliot', 'Ferrante', 'Fischer', 'Garcia', 'Gray', 'Hale', 'Hughes', 'Ishiguro',
+    'Jansen', 'Kawabata', 'Keller', 'Khan', 'Kowalski', 'Larsen', 'Le Guin', 'Lopez', 'Mann', 'Marquez',
+    'Moreau', 'Murakami', 'Nakamura', 'Novak', 'Okafor', 'Olsen', 'Pamuk', 'Petrov', 'Quinn', 'Rossi',
+    'Roy', 'Rushdie', 'Sato', 'Silva', 'Smith', 'Sousa', 'Tanaka', 'Tolstoy', 'Varga', 'Walker',
+    'Weber', 'Woolf', 'Yilmaz', 'Zhang',
+)
+# Most common first; weights fall off with the position
+GENRES = (
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'Thriller', 'Historical Fiction',
+    'Biography', 'History', 'Self-Help', 'Young Adult', 'Horror', 'Science', 'Philosophy', 'Travel',
+    'Classics', 'Memoir', 'Business', 'Psychology', 'Graphic Novel', 'Humor', 'Cooking', 'Art',
+    'Religion', 'Politics', 'Economics', 'Music', 'True Crime', 'Nature', 'Poetry',
+)
+ADJECTIVES = (
+    'Silent', 'Last', 'Hidden', 'Broken', 'Golden', 'Lost', 'Burning', 'Secret', 'Quiet', 'Wild',
+    'Forgotten', 'Crimson', 'Distant', 'Endless', 'Fallen', 'Hollow', 'Iron', 'Midnight', 'Northern',
+    'Painted', 'Restless', 'Shattered', 'Summer', 'Winter', 'Velvet',
+)
+NOUNS = (
+    'River', 'Garden', 'House', 'Storm', 'City', 'Kingdom', 'Shadow', 'Sea', 'Mountain', 'Letter',
+    'Library', 'Island', 'Road', 'Star', 'Forest', 'Bridge', 'Clock', 'Crown', 'Door', 'Empire',
+    'Harbor', 'Map', 'Mirror', 'Orchard', 'Song', 'Tower', 'Valley', 'Voyage', 'Witness', 'Year',
+)
+NOTE_WORDS = (
+    'loved', 'slow', 'start', 'brilliant', 'ending', 'characters', 'reread', 'recommended', 'by', 'a',
+    'friend', 'dense', 'but', 'rewarding', 'prose', 'plot', 'twist', 'chapter', 'favourite', 'quote',
+    'borrowed', 'from', 'the', 'library', 'book', 'club', 'pick', 'audiobook', 'narrator', 'setting',
+)
+TITLE_PATTERNS = (
+    'The {adj} {noun}', '{noun} of {noun2}s', 'A {noun} in the {noun2}', 'The {noun} and the {noun2}',
+    '{adj} {noun}s', 'Beyond the {adj} {noun}', 'The {noun} Keeper', 'Letters from the {noun}',
+)
+STATUSES = (('To Read', 60), ('Reading', 10), ('Finished', 30))
+FORMATS = (('Physical', 55), ('E-Book', 30), ('Audiobook', 15))
+# Ratings of finished books (unfinished ones are unrated)
+RATINGS = ((5, 20), (4, 35), (3, 25), (2, 12), (1, 8))
+# Days before the generation reference date that finish dates spread over
+DATE_SPAN_DAYS = 6 * 365
+REFERENCE_DATE = date(2026, 1, 1)
+
+
+def parse_size(value):
+    """Book count for '1k', '100k', '1m' or a plain number"""
+    value = str(value).strip().lower()
+    if value in SIZES:
+        return SIZES[value]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+
+def _zipf_cum_weights(count, exponent=1.0):
+    """Cumulative Zipf weights for ``random.choices()`` (computed once, not per draw)"""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def _pick(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def generate_records(count, seed=0):
+    """Yield ``count`` backup records, the same ones for the same ``seed``"""
+    rng = random.Random(seed)
+    # Authors ranked by popularity (a shuffled product of first and last names)
+    authors = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    rng.shuffle(authors)
+    author_weights = _zipf_cum_weights(len(authors), 0.8)
+    genre_weights = _zipf_cum_weights(len(GENRES), 0.9)
+
+    for index in range(count):
+        title = rng.choice(TITLE_PATTERNS).format(
+            adj=rng.choice(ADJECTIVES), noun=rng.choice(NOUNS), noun2=rng.choice(NOUNS))
+        if rng.random() < 0.3:
+            title += f', Book {rng.randint(2, 9)}'  # Series entries
+        status = _pick(rng, STATUSES)
+        total_pages = max(40, int(rng.lognormvariate(5.7, 0.45)))
+        record = {
+            'title': title,
+            'author': rng.choices(authors, cum_weights=author_weights)[0],
+            'status': status,
+            'format': _pick(rng, FORMATS),
+            'rating': 0,
+            'genres': list(dict.fromkeys(rng.choices(GENRES, cum_weights=genre_weights, k=rng.randint(1, 3)))),
+            'total_pages': total_pages,
+            'pages_read': 0,
+            'notes': '',
+            'cover_image': f'https://covers.example/{index}.jpg' if rng.random() < 0.7 else '',
+            'start_date': None,
+            'finish_date': None,
+        }
+        if rng.random() < 0.33:
+            record['notes'] = ' '.join(rng.choices(NOTE_WORDS, k=rng.randint(8, 60))).capitalize() + '.'
+        if status == 'Finished':
+            finish = REFERENCE_DATE - timedelta(days=rng.randrange(DATE_SPAN_DAYS))
+            record.update(
+                rating=_pick(rng, RATINGS),
+                pages_read=total_pages,
+                finish_date=finish.isoformat(),
+                start_date=(finish - timedelta(days=rng.randint(1, 120))).isoformat(),
+            )
+        elif status == 'Reading':
+            record.update(
+                pages_read=rng.randint(1, total_pages - 1),
+                start_date=(REFERENCE_DATE - timedelta(days=rng.randint(1, 90))).isoformat(),
+            )
+        yield record
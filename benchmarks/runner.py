@@ -0,0 +1,295 @@
+"""
+Benchmark cases, measurement, JSON baselines and regression checks.
+
+``build_cases()`` lists the requests to time, in groups:
+
+- ``index``: ``/`` for every sort key and order under each filter (none,
+  search, genre, rating, format, a progress range and the first four
+  together), plus a deep page;
+- ``search``: ``/search`` with a common word, an author, two words and a
+  query matching nothing;
+- ``dashboard`` and ``export`` (JSON, NDJSON and CSV, read to the end);
+- ``write``: ``add_book`` and ``update_book`` (the form and the POST);
+- ``api``: the Google Books routes against the local stub, uncached and
+  cached, including a batch ISBN lookup.
+
+``run_cases()`` sends each case through the Flask test client once to warm
+per-process caches, then ``repeat`` more times, recording wall time and the
+SQL statements of every request and the peak RSS of the process afterwards
+(a high-water mark, so it only grows from one case to the next). Results
+are plain dictionaries that ``save()`` writes as JSON and ``compare()``
+checks against an earlier run.
+"""
+
+import json
+import math
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from listing_spec import SORT_KEYS, SORT_ORDERS
+from models import db, Book, Genre, book_genre
+import query_budget
+
+# Books per page of the listing (index() shows 12)
+PAGE_SIZE = 12
+# ISBNs per batch lookup case
+BATCH_ISBNS = 20
+
+# Regression thresholds: relative slowdown, and absolute changes below which a difference is noise
+THRESHOLD = 0.2
+MIN_DELTA_MS = 2.0
+MIN_DELTA_RSS_MB = 16.0
+# Below this many samples p99 is just the slowest request, too noisy to compare
+P99_MIN_SAMPLES = 20
+
+
+class BenchmarkError(Exception):
+    """A benchmarked request did not answer as expected"""
+
+
+class Case:
+    """One benchmarked request.
+
+    ``request(iteration)`` returns the keyword arguments of
+    ``client.open()``; ``iteration`` is unique per call, for requests that
+    must differ every time (new books, uncached lookups).
+    """
+
+    def __init__(self, group, name, request, status=200):
+        self.group = group
+        self.name = name
+        self.request = request
+        self.status = status
+
+
+def _get(path):
+    return lambda iteration: {'method': 'GET', 'path': path}
+
+
+def library_profile():
+    """Values the cases query for: a common title word, a popular author and genre, a book id"""
+    common_author = db.session.query(Book.author).group_by(Book.author).order_by(
+        db.func.count().desc()).limit(1).scalar()
+    common_genre = db.session.query(Genre.name).join(book_genre).group_by(Genre.id).order_by(
+        db.func.count().desc()).limit(1).scalar()
+    title = db.session.query(Book.title).order_by(Book.id).limit(1).scalar() or ''
+    common_word = max(title.split(), key=len, default='')
+    middle = db.session.query(Book.id).order_by(Book.id).offset(
+        db.session.query(db.func.count(Book.id)).scalar() // 2).limit(1).scalar()
+    return {
+        'books': db.session.query(db.func.count(Book.id)).scalar(),
+        'word': common_word,
+        'author': common_author or '',
+        'genre': common_genre or '',
+        'book_id': middle,
+    }
+
+
+def build_cases(profile):
+    """Every benchmark case for a library described by ``library_profile()``"""
+    word, genre = profile['word'], profile['genre']
+    author_last_name = profile['author'].split()[-1] if profile['author'] else ''
+    filters = {
+        'all': {},
+        'search': {'search': word},
+        'genre': {'genre': genre},
+        'rating': {'rating': '4'},
+        'format': {'format': 'E-Book'},
+        'progress': {'progress_min': '90', 'progress_max': '99'},
+        'combined': {'search': word, 'genre': genre, 'rating': '4', 'format': 'E-Book'},
+    }
+    cases = []
+    for filter_name, params in filters.items():
+        sorts = [(key, order) for key in SORT_KEYS for order in SORT_ORDERS]
+        if 'search' in params:
+            sorts.append(('relevance', 'desc'))
+        for key, order in sorts:
+            query = '&'.join(f'{name}={value}' for name, value in {**params, 'sort': key, 'order': order}.items())
+            cases.append(Case('index', f'index {filter_name} {key}:{order}', _get(f'/?{query}')))
+    deep_page = max(1, profile['books'] // PAGE_SIZE // 2)
+    cases.append(Case('index', f'index all title:asc page={deep_page}', _get(f'/?page={deep_page}')))
+
+    for name, query in (('word', word), ('author', author_last_name), ('two words', f'{word} {genre}'),
+                        ('no match', 'qqqzzzxxy')):
+        cases.append(Case('search', f'search {name}', _get(f'/search?q={query}')))
+
+    cases.append(Case('dashboard', 'dashboard', _get('/dashboard')))
+    for export_format in ('json', 'ndjson', 'csv'):
+        cases.append(Case('export', f'export {export_format}', _get(f'/export?format={export_format}')))
+
+    cases.append(Case('write', 'add_book', lambda iteration: {
+        'method': 'POST', 'path': '/add',
+        'data': {'title': f'Benchmark Book {iteration}', 'author': profile['author'] or 'Benchmark Author',
+                 'format': 'Physical', 'rating': str(iteration % 6), 'total_pages': '320',
+                 'genres': [genre, f'Benchmark {iteration % 10}'], 'notes': 'Added by the benchmark.'},
+    }, status=302))
+    if profile['book_id'] is not None:
+        book_path = f"/update/{profile['book_id']}"
+        cases.append(Case('write', 'update_book form', _get(book_path)))
+        cases.append(Case('write', 'update_book', lambda iteration: {
+            'method': 'POST', 'path': book_path,
+            'data': {'title': f'Benchmark Update {iteration}', 'author': profile['author'] or 'Benchmark Author',
+                     'status': ('To Read', 'Reading', 'Finished')[iteration % 3], 'format': 'E-Book',
+                     'rating': str(iteration % 6), 'total_pages': '300', 'pages_read': str(iteration % 300),
+                     'notes': '', 'cover_image': '', 'genres': [genre, f'Benchmark {iteration % 10}']},
+        }, status=302))
+
+    cases.append(Case('api', 'api search uncached', lambda iteration: {
+        'method': 'GET', 'path': f'/api/search?q=benchmark-{iteration}'}))
+    cases.append(Case('api', 'api search cached', _get('/api/search?q=benchmark')))
+    cases.append(Case('api', 'api search 120 results', lambda iteration: {
+        'method': 'GET', 'path': f'/api/search?q=paged-{iteration}&limit=120'}))
+    cases.append(Case('api', 'api isbn uncached', lambda iteration: {
+        'method': 'GET', 'path': f'/api/search/isbn?isbn={9780000000000 + iteration}'}))
+    cases.append(Case('api', f'api isbn batch of {BATCH_ISBNS}', lambda iteration: {
+        'method': 'POST', 'path': '/api/search/isbn/batch',
+        'json': {'isbns': [str(9781000000000 + iteration * BATCH_ISBNS + index) for index in range(BATCH_ISBNS)]},
+    }))
+    return cases
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    """Largest resident set size of this process so far, in MiB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _send(client, case, iteration):
+    response = client.open(**case.request(iteration))
+    try:
+        response.get_data()  # Read streamed bodies (exports) to the end
+        if response.status_code != case.status:
+            raise BenchmarkError(f'{case.name}: HTTP {response.status_code}, expected {case.status}')
+    finally:
+        response.close()
+
+
+def run_case(client, case, repeat, iterations):
+    """Time ``repeat`` warm requests of one case; returns its result dictionary"""
+    _send(client, case, next(iterations))  # Warm-up
+    timings, statements = [], []
+    for _ in range(repeat):
+        with query_budget.count_statements() as counter:
+            started = time.perf_counter()
+            _send(client, case, next(iterations))
+            timings.append((time.perf_counter() - started) * 1000)
+        statements.append(counter.count)
+        db.session.remove()
+    return {
+        'group': case.group,
+        'samples': repeat,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(_percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'sql_statements': statistics.median_low(statements),
+        'sql_statements_max': max(statements),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_cases(app, cases, repeat, progress=None):
+    """Results of every case, keyed by case name; ``progress(name, result)`` after each"""
+    client = app.test_client()
+    iterations = count()
+    results = {}
+    for case in cases:
+        results[case.name] = run_case(client, case, repeat, iterations)
+        if progress:
+            progress(case.name, results[case.name])
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata(size, seed, repeat, profile):
+    """Description of the run stored next to the results"""
+    return {
+        'size': size,
+        'seed': seed,
+        'books': profile['books'],
+        'repeat': repeat,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def save(path, metadata, results):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({'meta': metadata, 'cases': results}, indent=2) + '\n')
+
+
+def load(path):
+    return json.loads(Path(path).read_text())
+
+
+def compare(results, baseline_results, threshold=THRESHOLD):
+    """Regressions of ``results`` against an earlier run.
+
+    A case regresses when its p50 (or, with P99_MIN_SAMPLES samples, its
+    p99) is more than ``threshold`` slower and at least MIN_DELTA_MS, when
+    it issues more SQL statements, or
+    when the peak RSS grew by more than ``threshold`` (and MIN_DELTA_RSS_MB).
+    Returns (case, metric, baseline value, current value) tuples.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baseline_results.get(name)
+        if baseline is None:
+            continue
+        metrics = ['p50_ms']
+        if min(result['samples'], baseline['samples']) >= P99_MIN_SAMPLES:
+            metrics.append('p99_ms')
+        for metric in metrics:
+            if result[metric] > baseline[metric] * (1 + threshold) and result[metric] - baseline[metric] >= MIN_DELTA_MS:
+                regressions.append((name, metric, baseline[metric], result[metric]))
+        if result['sql_statements'] > baseline['sql_statements']:
+            regressions.append((name, 'sql_statements', baseline['sql_statements'], result['sql_statements']))
+        old_rss, new_rss = baseline.get('peak_rss_mb'), result.get('peak_rss_mb')
+        if old_rss and new_rss and new_rss > old_rss * (1 + threshold) and new_rss - old_rss >= MIN_DELTA_RSS_MB:
+            regressions.append((name, 'peak_rss_mb', old_rss, new_rss))
+    return regressions
+
+
+def format_result(name, result, baseline=None):
+    """One report line: latency, SQL statements, peak RSS and the p50 change against ``baseline``"""
+    rss = f"{result['peak_rss_mb']:>8.1f}" if result['peak_rss_mb'] is not None else f"{'-':>8}"
+    line = (f"{name:<42} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['sql_statements']:>5} {rss}")
+    if baseline is not None:
+        change = (result['p50_ms'] - baseline['p50_ms']) / baseline['p50_ms'] * 100 if baseline['p50_ms'] else 0
+        line += f' {change:>+7.1f}%'
+    return line
+
+
+REPORT_HEADER = f"{'case':<42} {'p50 ms':>9} {'p99 ms':>9} {'sql':>5} {'rss MiB':>8}"
@@ -0,0 +1,79 @@
+"""
+Local stand-in for the Google Books volumes endpoint.
+
+``start(delay)`` serves deterministic volumes responses on a free local port
+(after ``delay`` seconds, to imitate a slow upstream) until ``shutdown()``
+is called on the returned server. Point ``GOOGLE_BOOKS_API_URL`` at
+``server.url``. Free-text queries get ``maxResults`` results out of
+STUB_TOTAL_ITEMS; ``isbn:`` queries get a single volume with that ISBN.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Results a free-text query reports in totalItems
+STUB_TOTAL_ITEMS = 120
+STUB_CATEGORIES = ('Fiction', 'Science Fiction', 'History', 'Biography', 'Fantasy')
+
+
+def volume(volume_id, title):
+    """One volumes item carrying every field the normalizer reads"""
+    info = {
+        'title': title,
+        'authors': ['Stub Author'],
+        'description': f'Description of {title}.',
+        'pageCount': 100 + len(title) * 7,
+        'publishedDate': '2001-01-01',
+        'categories': [STUB_CATEGORIES[len(title) % len(STUB_CATEGORIES)]],
+        'imageLinks': {'thumbnail': f'http://books.example/covers/{volume_id}.jpg'},
+    }
+    return {'id': volume_id, 'volumeInfo': info}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every GET after server.delay seconds"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    disable_nagle_algorithm = True  # Headers and body are separate writes
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get('q', [''])[0]
+        if query.startswith('isbn:'):
+            isbn = query[len('isbn:'):]
+            payload = {'totalItems': 1, 'items': [volume(isbn, f'Book {isbn}')]}
+        else:
+            start = int(params.get('startIndex', ['0'])[0])
+            size = int(params.get('maxResults', ['10'])[0])
+            items = [volume(f'{query}-{index}', f'{query} {index}')
+                     for index in range(start, min(start + size, STUB_TOTAL_ITEMS))]
+            payload = {'totalItems': STUB_TOTAL_ITEMS, 'items': items}
+
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent batch lookups connect at once; the default backlog of 5 drops connections
+    request_queue_size = 128
+
+
+def start(delay=0.0):
+    """Serve the stub on a background thread; returns the server (``.url``, ``.shutdown()``)"""
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.delay = delay
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/volumes'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,153 @@
+"""
+Cursor ("seek") pagination of the library listing.
+
+``keyset_page()`` implements Load More and infinite scroll: instead of
+``LIMIT/OFFSET`` plus ``COUNT(*)``, each page continues after the last seen
+``(sort_key, id)`` pair carried in an opaque cursor token, so page 500 costs
+the same index seek as page 1. The statements come prebuilt from the
+listing's spec (listing_spec.py).
+
+``flask pagination check`` walks every sort key and order through Load
+More to the end of the library and compares the result with the full
+listing: every book exactly once, in order, including across the rows whose
+sort value is NULL (unfinished books under the Finished sort).
+"""
+
+import base64
+import binascii
+import json
+
+import click
+from flask.cli import AppGroup
+
+from models import db, Book
+from listing_spec import Listing, SORTS, SORT_ORDERS
+
+# Load More batch size used by the check; odd, so page boundaries fall everywhere
+CHECK_PAGE_SIZE = 7
+
+pagination_cli = AppGroup('pagination', help='Check cursor pagination of the library listing.')
+
+
+class KeysetPage:
+    """One page of books fetched through a cursor (no total is counted)"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(sort_by, sort_order, book, served):
+    """Opaque token for the position right after ``book``.
+
+    ``served`` is the number of rows returned so far; it is only used when
+    the sort key cannot be seeked (relevance ranking or a NULL sort value).
+    """
+    sort_key = SORTS.get(sort_by)
+    value = sort_key.cursor_value(book) if sort_key is not None else None
+    payload = json.dumps([sort_by, sort_order, value, book.id, served], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort_by, sort_order):
+    """Return (value, last_id, served) or None for a missing or foreign cursor"""
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, last_id, served = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None  # Ignore tampered or truncated cursors
+    if (cursor_sort, cursor_order) != (sort_by, sort_order):
+        return None  # Cursor belongs to a different sort
+    sort_key = SORTS.get(sort_by)
+    try:
+        value = sort_key.seek_value(value) if sort_key is not None else value
+        return value, int(last_id), int(served)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_page(listing, cursor, per_page):
+    """Fetch the page of ``listing`` (a listing_spec.Listing) that follows ``cursor``.
+
+    Runs a single ``LIMIT per_page + 1`` query (the extra row tells whether a
+    next page exists) and no ``COUNT(*)``.
+    """
+    position = decode_cursor(cursor, listing.sort, listing.order)
+    sort_key = listing.sort_key
+    served = 0
+    variant, seek = 'page', {'listing_offset': 0}
+    null_tail = False
+    if position:
+        value, last_id, served = position
+        if sort_key is None or (value is None and sort_key.column is not Book.id):
+            # Not seekable: fall back to skipping the rows already served
+            seek = {'listing_offset': served}
+        elif sort_key.column is Book.id:
+            variant, seek = 'after_id', {'seek_id': last_id}
+        else:
+            variant, seek = 'after', {'seek_value': value, 'seek_id': last_id}
+            # NULLs sort last in descending order and never compare below the cursor
+            null_tail = listing.order == 'desc' and sort_key.nullable
+
+    rows = listing.fetch(variant, listing_limit=per_page + 1, **seek)
+    if null_tail and len(rows) <= per_page:
+        rows += listing.fetch('null_tail', listing_limit=per_page + 1 - len(rows))
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(listing.sort, listing.order, items[-1], served + len(items))
+    return KeysetPage(items, next_cursor)
+
+
+def walk_pages(listing, per_page):
+    """Ids of every book reached by following Load More cursors from the first page"""
+    ids, cursor = [], ''
+    while True:
+        page = keyset_page(listing, cursor, per_page)
+        ids.extend(book.id for book in page.items)
+        if not page.has_next:
+            return ids
+        cursor = page.next_cursor
+
+
+def check_pagination(per_page=CHECK_PAGE_SIZE):
+    """Compare Load More with the unpaginated listing for every sort and order.
+
+    Returns (description, problem or None) tuples.
+    """
+    results = []
+    for sort in SORTS:
+        for order in SORT_ORDERS:
+            listing = Listing(sort=sort, order=order)
+            expected = [book.id for book in listing.fetch('all', loader='results')]
+            walked = walk_pages(listing, per_page)
+            column = SORTS[sort].column
+            nulls = db.session.query(db.func.count(Book.id)).filter(column.is_(None)).scalar()
+            problem = None
+            if len(walked) != len(set(walked)):
+                problem = f'{len(walked) - len(set(walked))} book(s) served twice'
+            elif set(walked) != set(expected):
+                problem = f'{len(set(expected) - set(walked))} book(s) never served'
+            elif walked != expected:
+                problem = 'books served out of order'
+            results.append((f'{sort}:{order} ({len(expected)} books, {nulls} NULL)', problem))
+    return results
+
+
+@pagination_cli.command('check')
+@click.option('--per-page', default=CHECK_PAGE_SIZE, show_default=True, help='Books per Load More batch.')
+def check_command(per_page):
+    """Fail if Load More skips, repeats or reorders books for any sort."""
+    failures = 0
+    for description, problem in check_pagination(per_page):
+        failures += problem is not None
+        click.echo(f"{'FAIL' if problem else 'ok  '} {description}{': ' + problem if problem else ''}")
+    if failures:
+        raise click.ClickException(f'{failures} sort order(s) paginate incorrectly.')
+    click.echo('Load More serves every book exactly once, in listing order, for every sort.')
@@ -1,5 +1,52 @@
 import os
 
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
 class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///books.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # --- Engine profile (applied by database.py) ---
+
+    # Connection pool per engine (not used for in-memory SQLite)
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 5)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 10)
+    DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 30)  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 3600)  # seconds before a connection is replaced
+
+    # Read-only engine used by the listing GET routes. Defaults to the primary
+    # database (read-only connections on the same file); set DATABASE_REPLICA_URL
+    # to read from a replica instead, or READ_REPLICA=0 to read from the primary engine.
+    READ_REPLICA = os.environ.get('READ_REPLICA', '1') != '0'
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+    # Pragmas run on every new SQLite connection. WAL lets readers run while a
+    # write is in progress; busy_timeout makes a writer wait for the lock
+    # instead of failing with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # durable in WAL mode except on power loss; far fewer fsyncs
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT', 5000),  # milliseconds
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),  # bytes
+        'cache_size': -_env_int('SQLITE_CACHE_KB', 64 * 1024),  # negative: KiB per connection
+        'temp_store': 'MEMORY',
+    }
+
+    # --- Instrumentation (metrics.py) ---
+
+    # Add a Server-Timing header (app, db, tpl, gbooks durations) to every response
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+    # --- Background jobs (jobs.py, enrichment.py) ---
+
+    # Worker threads per web process, started with the first job (0: only
+    # 'flask jobs work' processes run jobs)
+    JOBS_WORKERS = _env_int('JOBS_WORKERS', 2)
+    JOBS_POLL_INTERVAL = _env_int('JOBS_POLL_INTERVAL', 2)  # seconds an idle worker waits between queue checks
+    JOBS_STALE_AFTER = _env_int('JOBS_STALE_AFTER', 300)  # seconds without progress before a running job is retried
+    # Google Books requests per second made by enrichment jobs, per process
+    ENRICH_RATE_LIMIT = float(os.environ.get('ENRICH_RATE_LIMIT', 2))
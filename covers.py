@@ -0,0 +1,334 @@
+"""
+Local cover-image proxy and thumbnail cache.
+
+``Book.cover_image`` holds remote URLs (mostly Google Books thumbnails).
+Instead of hotlinking them, templates use ``cover_src(book)``, which points
+at ``/covers/<book_id>?v=<url key>``. The first request fetches the remote
+image once, shrinks it to COVER_MAX_SIZE (WebP, or JPEG when Pillow has no
+WebP support) and stores it under ``instance/covers`` in a content-addressed
+layout:
+
+    covers/objects/ab/abcdef....webp   thumbnail, named by its SHA-256
+    covers/urls/12/1234....            url key -> object name
+
+The url key changes whenever a book's cover URL changes, so responses can
+be cached by browsers forever (strong ETag = content hash, ``immutable``).
+Cache hits are served from disk without touching the database.
+
+Only covers on public http(s) hosts are fetched: URLs whose host resolves
+to a loopback, private, link-local or otherwise non-global address are
+refused (redirects included), so a typed cover URL cannot make the server
+call internal services. The host is resolved again when connecting, so the
+address of the connected socket is checked too, before the request is sent:
+a DNS answer that changes after the first check (rebinding) is caught there. Keys from the query string and object names read
+from the index must have the exact shape this module writes.
+
+Pillow is optional: without it the original image bytes are stored as-is.
+``flask covers prefetch`` fills the cache for the whole library.
+"""
+
+import hashlib
+import ipaddress
+import os
+import re
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urljoin, urlsplit
+
+import click
+import requests
+from flask import abort, current_app, redirect, send_file, url_for
+from flask.cli import AppGroup
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: covers are stored unresized without Pillow
+    Image = None
+
+from models import db, Book
+
+# Thumbnails fit in this box (2x the 200px grid cover height)
+COVER_MAX_SIZE = (400, 400)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+# Remote images larger than this are not cached
+MAX_COVER_BYTES = 5 * 1024 * 1024
+# (connect, read) timeouts for fetching a cover
+FETCH_TIMEOUT = (3.05, 10)
+# Browser cache lifetime of a cover; URLs change with the cover, so a year is safe
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+PREFETCH_WORKERS = 8
+# Redirects followed when fetching a cover (each target is checked like the original URL)
+MAX_REDIRECTS = 3
+
+EXTENSION_MIMETYPES = {'.webp': 'image/webp', '.jpg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif'}
+MIMETYPE_EXTENSIONS = {mimetype: extension for extension, mimetype in EXTENSION_MIMETYPES.items()}
+MIMETYPE_EXTENSIONS['image/jpg'] = '.jpg'
+
+# Shapes of a url key (see url_key()) and of a stored object name
+KEY_PATTERN = re.compile(r'[0-9a-f]{32}')
+OBJECT_NAME_PATTERN = re.compile(r'[0-9a-f]{64}\.(webp|jpg|png|gif)')
+
+covers_cli = AppGroup('covers', help='Manage the local cover-image cache.')
+
+
+class CoverError(Exception):
+    """The remote cover could not be fetched or is not an image"""
+
+
+def is_remote(url):
+    return bool(url) and url.startswith(('http://', 'https://'))
+
+
+def _is_public_address(address):
+    address = ipaddress.ip_address(address.split('%')[0])  # Drop an IPv6 zone id
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def is_public_url(url):
+    """True for an http(s) URL whose host resolves to public addresses only"""
+    try:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return False
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+        return bool(addresses) and all(_is_public_address(info[4][0]) for info in addresses)
+    except (ValueError, OSError):
+        return False
+
+
+class _PublicPeerMixin:
+    def _new_conn(self):
+        sock = super()._new_conn()
+        address = sock.getpeername()[0]
+        if not _is_public_address(address):
+            sock.close()
+            raise CoverError(f'{self.host} connected to non-public address {address}')
+        return sock
+
+
+class _PublicHTTPConnection(_PublicPeerMixin, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicPeerMixin, HTTPSConnection):
+    pass
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """Transport adapter whose connections refuse non-public peer addresses"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _PublicHTTPConnectionPool,
+                                                   'https': _PublicHTTPSConnectionPool}
+
+
+def get_session():
+    """The app's session for cover downloads, created on first use"""
+    app = current_app._get_current_object()
+    session = app.extensions.get('covers')
+    if session is None:
+        session = requests.Session()
+        adapter = PublicAddressAdapter(pool_maxsize=PREFETCH_WORKERS)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session = app.extensions.setdefault('covers', session)
+    return session
+
+
+def url_key(url):
+    """Stable key of a cover URL, used in proxy URLs and the url index"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def cover_src(book):
+    """Image URL for a book's cover in templates: the local proxy for remote covers"""
+    if not is_remote(book.cover_image):
+        return book.cover_image or ''
+    return url_for('book_cover', book_id=book.id, v=url_key(book.cover_image))
+
+
+def cache_dir():
+    return current_app.config.get('COVER_CACHE_DIR') or os.path.join(current_app.instance_path, 'covers')
+
+
+def _index_path(root, key):
+    return os.path.join(root, 'urls', key[:2], key)
+
+
+def _object_path(root, name):
+    return os.path.join(root, 'objects', name[:2], name)
+
+
+def _write_atomic(path, data):
+    """Write via a temporary file and rename, so readers never see partial files"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def cached_object(root, key):
+    """Object name stored for a url key, or None"""
+    try:
+        with open(_index_path(root, key), encoding='ascii') as index_file:
+            name = index_file.read().strip()
+    except FileNotFoundError:
+        return None
+    if not OBJECT_NAME_PATTERN.fullmatch(name):
+        return None
+    return name if os.path.exists(_object_path(root, name)) else None
+
+
+def make_thumbnail(data, content_type):
+    """(bytes, extension) of the stored thumbnail"""
+    if Image is None:
+        extension = MIMETYPE_EXTENSIONS.get(content_type.split(';')[0].strip().lower())
+        if extension is None:
+            raise CoverError(f'Unsupported image type {content_type!r}')
+        return data, extension
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.thumbnail(COVER_MAX_SIZE)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            output = BytesIO()
+            try:
+                image.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+                return output.getvalue(), '.webp'
+            except (KeyError, OSError):  # Pillow built without WebP support
+                output = BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            return output.getvalue(), '.jpg'
+    except (OSError, ValueError) as e:
+        raise CoverError(f'Not a readable image: {e}') from e
+
+
+def fetch_cover(url, root, session):
+    """Download, shrink and store one cover; returns its object name"""
+    key = url_key(url)
+    name = cached_object(root, key)
+    if name:
+        return name
+
+    try:
+        location = url
+        for _ in range(MAX_REDIRECTS + 1):
+            if not is_public_url(location):
+                raise CoverError(f'Not a public http(s) URL: {location}')
+            with session.get(location, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False) as response:
+                if response.is_redirect:
+                    location = urljoin(location, response.headers['Location'])
+                    continue
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+                if not content_type.startswith('image/'):
+                    raise CoverError(f'Not an image: {content_type!r}')
+                data = response.raw.read(MAX_COVER_BYTES + 1, decode_content=True)
+            break
+        else:
+            raise CoverError('Too many redirects')
+        if len(data) > MAX_COVER_BYTES:
+            raise CoverError('Image too large')
+    except CoverError:
+        raise
+    except Exception as e:
+        raise CoverError(str(e)) from e
+
+    thumbnail, extension = make_thumbnail(data, content_type)
+    name = hashlib.sha256(thumbnail).hexdigest() + extension
+    object_path = _object_path(root, name)
+    if not os.path.exists(object_path):  # Identical images are stored once
+        _write_atomic(object_path, thumbnail)
+    _write_atomic(_index_path(root, key), name.encode('ascii'))
+    return name
+
+
+def cover_response(book_id, key):
+    """Serve a cached cover, fetching it on first use"""
+    if not KEY_PATTERN.fullmatch(key or ''):
+        abort(404)
+    root = cache_dir()
+    name = cached_object(root, key)
+    if name is None:
+        book = db.session.get(Book, book_id)
+        if book is None or not is_remote(book.cover_image):
+            abort(404)
+        if url_key(book.cover_image) != key:
+            # The cover changed since the page was rendered
+            return redirect(url_for('book_cover', book_id=book_id, v=url_key(book.cover_image)))
+        if not is_public_url(book.cover_image):
+            abort(404)
+        try:
+            name = fetch_cover(book.cover_image, root, get_session())
+        except CoverError as e:
+            current_app.logger.warning('Cover for book %s not cached: %s', book_id, e)
+            # Fall back to the (public, checked above) remote image rather than showing nothing
+            response = redirect(book.cover_image)
+            response.cache_control.max_age = 300
+            return response
+
+    content_hash, extension = os.path.splitext(name)
+    response = send_file(
+        _object_path(root, name),
+        mimetype=EXTENSION_MIMETYPES.get(extension, 'application/octet-stream'),
+        etag=content_hash,
+        conditional=True,
+        max_age=CACHE_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@covers_cli.command('prefetch')
+@click.option('--workers', default=PREFETCH_WORKERS, show_default=True, help='Concurrent downloads.')
+def prefetch_command(workers):
+    """Download and cache the cover of every book."""
+    root = cache_dir()
+    urls = [url for (url,) in db.session.query(Book.cover_image).distinct() if is_remote(url)]
+    missing = [url for url in urls if cached_object(root, url_key(url)) is None]
+    click.echo(f'{len(urls)} cover URLs, {len(urls) - len(missing)} already cached.')
+    if not missing:
+        return
+
+    session = get_session()
+
+    def fetch(url):
+        try:
+            fetch_cover(url, root, session)
+            return None
+        except CoverError as e:
+            return f'{url}: {e}'
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for done, error in enumerate(pool.map(fetch, missing), 1):
+            if error:
+                failed += 1
+                click.echo(f'  failed {error}')
+            if done % 100 == 0:
+                click.echo(f'... {done}/{len(missing)}')
+    click.echo(f'Cached {len(missing) - failed} covers ({failed} failed).')
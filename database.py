@@ -0,0 +1,158 @@
+"""
+Engine profile: SQLite pragmas, connection pooling and a read replica.
+
+Settings come from ``config.Config`` (see the ``DB_*``, ``READ_REPLICA`` and
+``SQLITE_PRAGMAS`` entries). ``init_app()`` wires them into Flask-SQLAlchemy:
+
+* Every new SQLite connection runs ``SQLITE_PRAGMAS`` (WAL journal,
+  ``synchronous=NORMAL``, ``busy_timeout``, ``mmap_size``, ``cache_size``,
+  ``temp_store=MEMORY``), so concurrent workers wait for the write lock
+  instead of failing with "database is locked", and readers never block on
+  a writer.
+* File databases get a sized ``QueuePool`` (``DB_POOL_SIZE``,
+  ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE``).
+* A second engine, the ``replica`` bind, serves views decorated with
+  ``@read_replica``. It points at ``DATABASE_REPLICA_URL`` or, by default,
+  at the primary database file, and its connections are ``query_only`` so a
+  stray write fails loudly instead of taking the write lock. Writes, flushes
+  and sessions holding pending changes always go to the primary engine.
+
+SQLite and PostgreSQL are both supported (``DATABASE_URL=postgresql://...``,
+with a driver such as ``psycopg2-binary`` installed). The few SQL constructs
+that differ between them go through the helpers at the end of this module:
+``insert()`` (for ``ON CONFLICT``), ``date_format()`` and ``days_between()``.
+"""
+
+import functools
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Integer, String, cast, event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND = 'replica'
+# Pragmas that change the database file rather than the connection
+FILE_PRAGMAS = ('journal_mode',)
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of ``@read_replica`` views to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        return (has_request_context()
+                and getattr(current_app.view_functions.get(request.endpoint), 'read_replica', False)
+                and not self._flushing
+                and not isinstance(clause, UpdateBase)
+                and REPLICA_BIND in self._db.engines
+                and not (self.new or self.dirty or self.deleted))
+
+
+def read_replica(view):
+    """Mark a read-only view: its queries run against the replica engine"""
+    view.read_replica = True
+    return view
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url):
+    """Pool settings for an engine on ``url`` (none for in-memory SQLite)"""
+    if _is_memory_sqlite(url):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if url.get_backend_name() != 'sqlite':
+        options['pool_pre_ping'] = True  # Drop connections closed by the server
+    return options
+
+
+def configure(config):
+    """Fill the engine options and the replica bind in ``config`` (before db.init_app)"""
+    for key in ('SQLALCHEMY_DATABASE_URI', 'DATABASE_REPLICA_URL'):
+        # Hosting providers hand out postgres:// URLs, which SQLAlchemy no longer accepts
+        if (config.get(key) or '').startswith('postgres://'):
+            config[key] = 'postgresql://' + config[key][len('postgres://'):]
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(config, url).items():
+        options.setdefault(key, value)
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url is None and url.get_backend_name() == 'sqlite' and not _is_memory_sqlite(url):
+        replica_url = config['SQLALCHEMY_DATABASE_URI']
+    if config.get('READ_REPLICA') and replica_url:
+        binds = config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **engine_options(config, make_url(replica_url))})
+
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_app(app, db):
+    """Configure the engines of ``db`` for ``app`` from its config"""
+    configure(app.config)
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            engine_pragmas = list(pragmas.items())
+            if key == REPLICA_BIND:
+                engine_pragmas = [(name, value) for name, value in engine_pragmas if name not in FILE_PRAGMAS]
+                engine_pragmas.append(('query_only', 'ON'))
+            event.listen(engine, 'connect', functools.partial(_apply_pragmas, engine_pragmas))
+
+
+# --- BACKEND-SPECIFIC SQL ---
+
+# strftime() formats used by the statistics, as PostgreSQL to_char() patterns
+POSTGRES_DATE_FORMATS = {'%Y-%m': 'YYYY-MM', '%m': 'MM'}
+
+
+def backend():
+    """Dialect name of the primary engine: 'sqlite' or 'postgresql'"""
+    return current_app.extensions['sqlalchemy'].engine.dialect.name
+
+
+def insert(table):
+    """INSERT construct supporting ``on_conflict_do_nothing/do_update`` on the current backend"""
+    if backend() == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def date_format(column, fmt):
+    """A date column as text in SQLite strftime() format '%Y-%m', '%m' or '%w' (0 = Sunday)"""
+    if backend() != 'postgresql':
+        return func.strftime(fmt, column)
+    if fmt == '%w':
+        return cast(cast(func.extract('dow', column), Integer), String)
+    return func.to_char(column, POSTGRES_DATE_FORMATS[fmt])
+
+
+def days_between(end, start):
+    """Whole days from ``start`` to ``end`` (two date columns)"""
+    if backend() == 'postgresql':
+        return end - start  # date - date is an integer number of days
+    return cast(func.julianday(end) - func.julianday(start), Integer)
@@ -0,0 +1,195 @@
+"""
+Google Books enrichment of existing books, run as a background job.
+
+Books added by hand or from old backups often lack a page count, a cover
+or genres. The ``enrich_books`` job (queued by ``POST /jobs/enrich`` or
+``flask jobs enrich``) looks each such book up by title and author and
+fills in only the fields that are still empty; nothing the user entered is
+overwritten.
+
+Books are processed in batches of BATCH_SIZE: the lookups run outside any
+transaction, then the batch is written in one short transaction together
+with the summary-table deltas (library_stats.py), a library version bump
+(http_cache.py) and the job's progress. An interrupted job that is claimed
+again therefore skips the books already enriched.
+
+Upstream requests go through a per-process RateLimiter at
+ENRICH_RATE_LIMIT requests per second, shared by all jobs in the process,
+so a backfill of a large library does not exhaust the API quota that the
+interactive search routes also use.
+"""
+
+import threading
+import time
+
+import click
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from models import db, Book
+import genre_resolver
+import google_books
+import http_cache
+import jobs
+import library_stats
+
+KIND = 'enrich_books'
+# Book fields the job can fill in
+FIELDS = ('total_pages', 'cover_image', 'genres')
+# Books looked up, then written in one transaction
+BATCH_SIZE = 20
+# Search results considered per book
+MAX_CANDIDATES = 5
+# Book.cover_image column length
+MAX_COVER_URL_LENGTH = 200
+
+# Per-process limiters by rate, shared by the worker threads
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads (no limit when rate <= 0)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def limiter(rate):
+    """The process-wide RateLimiter for ``rate`` requests per second"""
+    with _limiters_lock:
+        return _limiters.setdefault(rate, RateLimiter(rate))
+
+
+def parse_fields(values):
+    """Validated field names (all FIELDS when none are given); raises ValueError for unknown ones"""
+    fields = [value.strip() for value in values or () if value and value.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}; choose from {", ".join(FIELDS)}')
+    return list(dict.fromkeys(fields)) or list(FIELDS)
+
+
+# field -> criterion of a book missing it
+MISSING = {
+    'total_pages': lambda: db.or_(Book.total_pages.is_(None), Book.total_pages <= 0),
+    'cover_image': lambda: db.or_(Book.cover_image.is_(None), Book.cover_image == ''),
+    'genres': lambda: ~Book.genres.any(),
+}
+
+
+def missing_fields(book, fields):
+    if 'total_pages' in fields and not (book.total_pages or 0) > 0:
+        yield 'total_pages'
+    if 'cover_image' in fields and not book.cover_image:
+        yield 'cover_image'
+    if 'genres' in fields and not book.genres:
+        yield 'genres'
+
+
+def search_query(title, author):
+    """Google Books query for a book by title (and author, when known)"""
+    query = f'intitle:{title}'
+    if author and author != 'Unknown Author':
+        query += f' inauthor:{author}'
+    return query
+
+
+def lookup(client, title, author):
+    """The best-matching VolumeRecord for a book, or None"""
+    data = client.search(search_query(title, author), max_results=MAX_CANDIDATES)
+    records = google_books.normalize_volumes(data, ('title', 'page_count', 'cover_url', 'categories'))
+    # Prefer an exact title match, then the first result
+    wanted = title.casefold()
+    records.sort(key=lambda record: record.title.casefold() != wanted)
+    return records[0] if records else None
+
+
+def _apply(book, record, fields):
+    """Fill the missing ``fields`` of ``book`` from ``record``; returns the fields set"""
+    filled = []
+    for field in missing_fields(book, fields):
+        if field == 'total_pages' and record.page_count:
+            book.total_pages = record.page_count
+        elif field == 'cover_image' and record.cover_url and len(record.cover_url) <= MAX_COVER_URL_LENGTH:
+            book.cover_image = record.cover_url
+        elif field == 'genres' and genre_resolver.clean_names(record.categories):
+            genre_resolver.set_book_genres(book, record.categories)
+        else:
+            continue
+        filled.append(field)
+    return filled
+
+
+@jobs.handler(KIND)
+def enrich_books(job):
+    """Backfill missing fields of the library (or of ``book_ids``) from Google Books"""
+    fields = parse_fields(job.params.get('fields'))
+    query = db.session.query(Book.id).filter(db.or_(*(MISSING[field]() for field in fields)))
+    if job.params.get('book_ids'):
+        query = query.filter(Book.id.in_(job.params['book_ids']))
+    book_ids = [book_id for (book_id,) in query.order_by(Book.id)]
+    job.set_total(len(book_ids))
+    db.session.commit()
+
+    client = google_books.get_client()
+    rate_limit = limiter(current_app.config['ENRICH_RATE_LIMIT'])
+    result = {'checked': 0, 'updated': 0, 'not_found': 0, 'failed': 0, 'filled': dict.fromkeys(fields, 0)}
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        batch = book_ids[start:start + BATCH_SIZE]
+        books = db.session.query(Book.id, Book.title, Book.author).filter(Book.id.in_(batch)).all()
+        db.session.rollback()  # Do not hold a transaction open during the lookups
+
+        records = {}
+        for book_id, title, author in books:
+            rate_limit.wait()
+            try:
+                records[book_id] = lookup(client, title, author)
+            except google_books.GoogleBooksError as e:
+                current_app.logger.warning('Enrichment lookup failed for book %s: %s', book_id, e)
+                result['failed'] += 1
+
+        updated = 0
+        found = {book_id: record for book_id, record in records.items() if record is not None}
+        result['not_found'] += len(records) - len(found)
+        if found:
+            for book in db.session.query(Book).options(selectinload(Book.genres)).filter(Book.id.in_(found)).all():
+                before = library_stats.snapshot(book)
+                filled = _apply(book, found[book.id], fields)
+                if not filled:
+                    continue
+                db.session.flush()
+                library_stats.record_change(before, library_stats.snapshot(book))
+                updated += 1
+                for field in filled:
+                    result['filled'][field] += 1
+            if updated:
+                http_cache.bump_version()
+        result['checked'] += len(batch)
+        result['updated'] += updated
+        job.advance(len(batch))
+        db.session.commit()
+    return result
+
+
+@jobs.jobs_cli.command('enrich')
+@click.option('--field', 'fields', multiple=True, type=click.Choice(FIELDS),
+              help='Field to backfill (repeatable; default: all).')
+def enrich_command(fields):
+    """Queue a Google Books enrichment of books with missing fields."""
+    if not jobs.is_available():
+        raise click.ClickException('Job table not found; run "flask db upgrade" first.')
+    job = jobs.enqueue(KIND, {'fields': parse_fields(fields)})
+    click.echo(f'Queued job {job.id}; run "flask jobs work" to process it.')
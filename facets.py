@@ -0,0 +1,166 @@
+"""
+Genre and format facets for the listing filter dropdowns.
+
+The dropdowns list every genre and every format in the library, each with
+the number of books it would show given the other active filters
+("Fantasy (312)"). Faceting follows the usual rule: the genre counts apply
+every filter except the genre filter, and likewise for formats, so picking
+a genre never zeroes out the other genres.
+
+Results are cached in-process per filter set and library version (see
+http_cache.py; the version is read once per request and shared with
+``cached_view``). Every writer bumps the version in its own transaction,
+so a write in any worker process makes the next request of every other
+process miss the cache; old entries simply age out of the LRU. Each facet
+costs at most one grouped query when the cache is cold: the unfiltered
+lists come from ``genre LEFT JOIN book_genre`` and from ``book`` grouped by
+format (both served by covering indexes), and filtered counts from one
+grouped query per facet.
+
+Databases without the ``library_version`` table fall back to dropping the
+cache after any commit that flushed a ``Book`` or ``Genre`` (ORM session
+events) or on ``invalidate()``, with entries expiring after FACET_TTL
+seconds.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Book, Genre, book_genre
+from listing_spec import Listing
+import http_cache
+
+# Seconds a cached facet list is trusted when the library version is not tracked
+FACET_TTL = 300
+# Filter sets kept in the cache
+MAX_CACHED_FILTER_SETS = 256
+
+_cache = OrderedDict()  # (engine url, library version, filter key) -> (expires_at, Facets)
+_lock = threading.Lock()
+
+
+class Facets:
+    """Dropdown options with counts under the current filters"""
+
+    __slots__ = ('genres', 'formats')
+
+    def __init__(self, genres, formats):
+        self.genres = genres  # [(name, count)], every genre in the library
+        self.formats = formats  # [(format, count)], every format in the library
+
+    @property
+    def genre_names(self):
+        return [name for name, _ in self.genres]
+
+    @property
+    def format_names(self):
+        return [fmt for fmt, _ in self.formats]
+
+
+def _active(value):
+    return '' if value in (None, 'all') else value
+
+
+def _genre_counts(search_query, filters):
+    """{genre name: matching books}, ignoring the genre filter"""
+    query = (db.session.query(Genre.name, db.func.count(Book.id))
+             .select_from(Book)
+             .join(book_genre, book_genre.c.book_id == Book.id)
+             .join(Genre, Genre.id == book_genre.c.genre_id))
+    listing = Listing(search_query, {name: value for name, value in filters.items() if name != 'genre'})
+    query = listing.apply_filters(query)
+    return dict(query.group_by(Genre.name).all())
+
+
+def _format_counts(search_query, filters):
+    """{format: matching books}, ignoring the format filter"""
+    query = db.session.query(Book.format, db.func.count(Book.id)).select_from(Book)
+    listing = Listing(search_query, {name: value for name, value in filters.items() if name != 'format'})
+    query = listing.apply_filters(query)
+    return dict(query.group_by(Book.format).all())
+
+
+def _all_facets():
+    """Every genre and format with its unfiltered count"""
+    genres = (db.session.query(Genre.name, db.func.count(book_genre.c.book_id))
+              .outerjoin(book_genre, book_genre.c.genre_id == Genre.id)
+              .group_by(Genre.id)
+              .order_by(Genre.name)
+              .all())
+    formats = (db.session.query(Book.format, db.func.count(Book.id))
+               .group_by(Book.format)
+               .order_by(Book.format)
+               .all())
+    return Facets([(name, count) for name, count in genres if name],
+                  [(fmt, count) for fmt, count in formats if fmt])
+
+
+def _compute(search_query, genre_filter, rating_filter, format_filter, progress_min, progress_max):
+    base = _cached(('', '', '', '', '', ''), _all_facets)
+    genres, formats = base.genres, base.formats
+    filters = {'genre': genre_filter, 'rating': rating_filter, 'format': format_filter,
+               'progress_min': progress_min, 'progress_max': progress_max}
+    if search_query or any(value for name, value in filters.items() if name != 'genre'):
+        counts = _genre_counts(search_query, filters)
+        genres = [(name, counts.get(name, 0)) for name, _ in genres]
+    if search_query or any(value for name, value in filters.items() if name != 'format'):
+        counts = _format_counts(search_query, filters)
+        formats = [(fmt, counts.get(fmt, 0)) for fmt, _ in formats]
+    return Facets(genres, formats)
+
+
+def _cached(filters, compute):
+    key = (str(db.engine.url), http_cache.current_version(), filters)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    facets = compute()
+    with _lock:
+        _cache[key] = (now + FACET_TTL, facets)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_FILTER_SETS:
+            _cache.popitem(last=False)
+    return facets
+
+
+def listing_facets(search_query='', genre_filter='', rating_filter='', format_filter='',
+                   progress_min='', progress_max=''):
+    """Facets for the given listing filters (the parameters of index())"""
+    filters = tuple(_active(value) for value in (search_query, genre_filter, rating_filter, format_filter,
+                                                 progress_min, progress_max))
+    return _cached(filters, lambda: _compute(*filters))
+
+
+def invalidate():
+    """Drop every cached facet list"""
+    with _lock:
+        _cache.clear()
+
+
+# --- INVALIDATION (ORM events) ---
+
+@event.listens_for(Session, 'after_flush')
+def _note_facet_changes(session, flush_context):
+    # Collection changes (book.genres) put the book in session.dirty as well
+    if any(isinstance(obj, (Book, Genre)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['facets_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('facets_changed', False):
+        invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_changes(session, previous_transaction):
+    session.info.pop('facets_changed', None)
@@ -0,0 +1,73 @@
+"""
+Genre resolution shared by every write path.
+
+Books reference genres by name in forms, API lookups and imports. Resolving
+names one ``filter_by(name=...).first()`` at a time costs a query (and a
+flush for new genres) per tag, and two concurrent writers adding the same
+new genre race on the unique ``Genre.name`` constraint. Here a whole set of
+names is resolved with one ``IN`` select; missing genres are created with a
+single ``INSERT ... ON CONFLICT DO NOTHING`` followed by one more select, so
+a genre created concurrently by another writer is simply picked up.
+
+``set_book_genres()`` diffs a book's genre collection against the wanted
+names, so only added or removed links touch ``book_genre`` instead of
+deleting and re-inserting every association row.
+"""
+
+from models import db, Genre
+import database
+
+# Genre.name column length
+MAX_NAME_LENGTH = 50
+
+
+def clean_names(names):
+    """Stripped, truncated, de-duplicated names in their original order"""
+    cleaned = (name.strip()[:MAX_NAME_LENGTH] for name in names if name and name.strip())
+    return list(dict.fromkeys(cleaned))
+
+
+def resolve_ids(names, cache):
+    """Fill ``cache`` (name -> id) for ``names``, creating missing genres.
+
+    At most two selects and one batched insert, whatever the number of names.
+    """
+    missing = [name for name in names if name not in cache]
+    if not missing:
+        return cache
+    connection = db.session.connection()
+    select_ids = db.select(Genre.name, Genre.id).where(Genre.name.in_(missing))
+    cache.update(connection.execute(select_ids).all())
+
+    new_names = [{'name': name} for name in missing if name not in cache]
+    if new_names:
+        connection.execute(database.insert(Genre.__table__).on_conflict_do_nothing(), new_names)
+        cache.update(connection.execute(select_ids).all())
+    return cache
+
+
+def resolve(names):
+    """{name: Genre} for ``names`` (cleaned), creating missing genres"""
+    names = clean_names(names)
+    if not names:
+        return {}
+    genres = {genre.name: genre for genre in db.session.query(Genre).filter(Genre.name.in_(names))}
+    missing = [name for name in names if name not in genres]
+    if missing:
+        db.session.connection().execute(
+            database.insert(Genre.__table__).on_conflict_do_nothing(), [{'name': name} for name in missing]
+        )
+        genres.update((genre.name, genre) for genre in db.session.query(Genre).filter(Genre.name.in_(missing)))
+    return {name: genres[name] for name in names}
+
+
+def set_book_genres(book, names):
+    """Make ``book.genres`` match ``names``, adding and removing only the difference"""
+    wanted = resolve(names)
+    for genre in list(book.genres):
+        if genre.name not in wanted:
+            book.genres.remove(genre)
+    current = {genre.name for genre in book.genres}
+    for name, genre in wanted.items():
+        if name not in current:
+            book.genres.append(genre)
@@ -0,0 +1,434 @@
+"""
+Google Books API client shared by the search and ISBN lookup routes.
+
+Every request goes through one pooled ``requests.Session`` (keep-alive, so
+repeated lookups reuse the TLS connection) with strict connect/read
+timeouts. Responses are cached by normalized query: an in-process TTL+LRU
+cache answers repeated ISBN scans and typeahead searches without leaving
+the process, and an optional SQLite file (``GOOGLE_BOOKS_CACHE_DB``) keeps
+them across restarts and worker processes. Identical queries that are in
+flight at the same time are coalesced into a single upstream request.
+``lookup_isbns()`` resolves a whole batch of ISBNs, fetching the ones that
+are not cached on a bounded thread pool.
+
+Responses are normalized by ``normalize_volumes()`` into ``VolumeRecord``
+objects (``__slots__``, only the requested fields are extracted), and
+``iter_search()`` pages through results lazily with
+``startIndex``/``maxResults``. Cached responses keep only the volumeInfo
+keys the normalizer reads.
+
+Configuration (``app.config``):
+
+- ``GOOGLE_BOOKS_API_URL``: volumes endpoint, e.g. a local stub server
+- ``GOOGLE_BOOKS_API_KEY``: optional API key sent with every request
+- ``GOOGLE_BOOKS_CACHE_DB``: optional path of the persistent cache
+- ``GOOGLE_BOOKS_CACHE_TTL``: seconds a response stays fresh
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+API_URL = 'https://www.googleapis.com/books/v1/volumes'
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 8)
+# Keep-alive connections kept open to the API
+POOL_SIZE = 16
+# Responses kept in memory, and for how long
+CACHE_MAX_ENTRIES = 2048
+CACHE_TTL = 24 * 60 * 60
+# Concurrent upstream requests per batch lookup (at most POOL_SIZE)
+BATCH_WORKERS = 8
+# Largest number of ISBNs accepted by one batch lookup
+MAX_BATCH_SIZE = 500
+# Largest page the API returns (maxResults), and the most results one search may page through
+MAX_PAGE_SIZE = 40
+MAX_SEARCH_RESULTS = 200
+
+# Fields of a normalized result
+VOLUME_FIELDS = ('title', 'author', 'description', 'page_count', 'cover_url', 'published_date',
+                 'average_rating', 'categories', 'preview_url', 'id')
+# volumeInfo keys the normalizer reads; cached responses are trimmed to these
+VOLUME_INFO_KEYS = ('title', 'authors', 'description', 'pageCount', 'imageLinks', 'publishedDate',
+                    'averageRating', 'categories', 'previewLink')
+
+
+class GoogleBooksError(Exception):
+    """The API could not be reached or returned an error"""
+
+
+def normalize_query(query):
+    """Cache key for a free-text search: lowercase, single-spaced"""
+    return ' '.join(query.lower().split())
+
+
+def normalize_isbn(isbn):
+    """Strip separators and convert ISBN-10 to ISBN-13, so both scans of a book share a cache entry.
+
+    Returns '' when the value is not an ISBN.
+    """
+    isbn = re.sub(r'[^0-9Xx]', '', isbn).upper()
+    if len(isbn) == 10 and isbn[:9].isdigit():
+        core = '978' + isbn[:9]
+        check = (10 - sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(core)) % 10) % 10
+        return core + str(check)
+    if len(isbn) == 13 and isbn.isdigit():
+        return isbn
+    return ''
+
+
+def search_request(query, start_index=0, max_results=None):
+    """(cache key, API params) of one page of a free-text search, or None for an empty query"""
+    query = normalize_query(query)
+    if not query:
+        return None
+    params = {'q': query}
+    key = 'q:' + query
+    if start_index or max_results:
+        params.update(startIndex=start_index, maxResults=min(max_results or 10, MAX_PAGE_SIZE))
+        key += f'|{start_index}|{params["maxResults"]}'
+    return key, params
+
+
+def isbn_request(isbn):
+    """(cache key, API params) of an ISBN lookup"""
+    normalized = normalize_isbn(isbn)
+    if not normalized:
+        # Not a valid ISBN; still ask the API, as the original route did
+        query = 'isbn:' + isbn.strip()
+        return 'q:' + normalize_query(query), {'q': query}
+    return 'isbn:' + normalized, {'q': 'isbn:' + normalized}
+
+
+def _author(volume_info):
+    authors = volume_info.get('authors', ['Unknown Author'])
+    return ', '.join(authors) if authors else 'Unknown Author'
+
+
+def _cover_url(volume_info):
+    image_links = volume_info.get('imageLinks', {})
+    return image_links.get('thumbnail', '') or image_links.get('smallThumbnail', '')
+
+
+# field -> function(volume_info, item) extracting it
+FIELD_EXTRACTORS = {
+    'title': lambda info, item: info.get('title', 'Unknown Title'),
+    'author': lambda info, item: _author(info),
+    'description': lambda info, item: info.get('description', 'No description available'),
+    'page_count': lambda info, item: info.get('pageCount', 0),
+    'cover_url': lambda info, item: _cover_url(info),
+    'published_date': lambda info, item: info.get('publishedDate', ''),
+    'average_rating': lambda info, item: info.get('averageRating', 0),
+    'categories': lambda info, item: info.get('categories', []),
+    'preview_url': lambda info, item: info.get('previewLink', ''),
+    'id': lambda info, item: item.get('id', ''),
+}
+
+
+class VolumeRecord:
+    """One normalized volume; only the projected ``fields`` are extracted and set"""
+
+    __slots__ = VOLUME_FIELDS + ('_fields',)
+
+    def __init__(self, item, fields=VOLUME_FIELDS):
+        volume_info = item.get('volumeInfo', {})
+        self._fields = fields
+        for field in fields:
+            setattr(self, field, FIELD_EXTRACTORS[field](volume_info, item))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+
+def parse_fields(value):
+    """Projection from a comma-separated ``fields`` parameter; unknown names are ignored.
+
+    Returns VOLUME_FIELDS when nothing valid is requested.
+    """
+    fields = tuple(field for field in dict.fromkeys((value or '').replace(' ', '').split(','))
+                   if field in FIELD_EXTRACTORS)
+    return fields or VOLUME_FIELDS
+
+
+def normalize_volumes(data, fields=VOLUME_FIELDS):
+    """VolumeRecords for the items of a volumes response"""
+    return [VolumeRecord(item, fields) for item in data.get('items', [])]
+
+
+def _compact(data):
+    """Drop everything from a volumes response that the normalizer does not read"""
+    compact = {
+        'items': [
+            {
+                'id': item.get('id', ''),
+                'volumeInfo': {key: value for key, value in item.get('volumeInfo', {}).items()
+                               if key in VOLUME_INFO_KEYS},
+            }
+            for item in data.get('items', [])
+        ],
+    }
+    if 'totalItems' in data:
+        compact['totalItems'] = data['totalItems']
+    return compact
+
+
+class SearchPages:
+    """Paging state of a search that fetches pages until ``limit`` results are collected"""
+
+    def __init__(self, start_index=0, limit=None, page_size=MAX_PAGE_SIZE):
+        self.start_index = start_index
+        self.remaining = limit
+        self.page_size = page_size
+        self.size = page_size if limit is None else min(page_size, limit)  # next page; 0 when done
+
+    def add(self, data, fields):
+        """Records of a fetched page (within the limit), advancing to the next page"""
+        records = normalize_volumes(data, fields)
+        page = records if self.remaining is None else records[:self.remaining]
+        self.start_index += len(records)
+        if self.remaining is not None:
+            self.remaining -= len(records)
+        total = data.get('totalItems')
+        if (len(records) < self.size or (total is not None and self.start_index >= total)
+                or (self.remaining is not None and self.remaining <= 0)):
+            self.size = 0
+        else:
+            self.size = self.page_size if self.remaining is None else min(self.page_size, self.remaining)
+        return page
+
+
+class TTLCache:
+    """Thread-safe in-memory cache with per-entry expiry and LRU eviction"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Persistent cache tier in its own SQLite file, shared by all worker processes"""
+
+    def __init__(self, path, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, body TEXT NOT NULL)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT body FROM api_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO api_cache (key, expires_at, body) VALUES (?, ?, ?)",
+                (key, time.time() + self.ttl, json.dumps(value)),
+            )
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM api_cache")
+
+
+class GoogleBooksClient:
+    """Cached, pooled client for the volumes endpoint.
+
+    Safe to share between threads; the routes use one instance per app
+    (see ``get_client()``).
+    """
+
+    def __init__(self, api_url=API_URL, api_key=None, cache_path=None, ttl=CACHE_TTL,
+                 timeout=TIMEOUT, session=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = session or self._build_session()
+        self.cache = TTLCache(ttl=ttl)
+        self.persistent_cache = SQLiteCache(cache_path, ttl) if cache_path else None
+        self._in_flight = {}  # cache key -> Future of the upstream response
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'persistent_hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    @staticmethod
+    def _build_session():
+        session = requests.Session()
+        # Retry connection failures and throttling briefly; slow reads are not retried
+        retry = Retry(total=2, connect=2, read=0, status=1, backoff_factor=0.2,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def search(self, query, start_index=0, max_results=None):
+        """Volumes response for one page of a free-text search"""
+        request = search_request(query, start_index, max_results)
+        if request is None:
+            return {}
+        return self._cached(*request)
+
+    def iter_search(self, query, fields=VOLUME_FIELDS, start_index=0, limit=None, page_size=MAX_PAGE_SIZE):
+        """Yield VolumeRecords for a search, fetching further pages only as they are consumed"""
+        pages = SearchPages(start_index, limit, page_size)
+        while pages.size:
+            records = pages.add(self.search(query, pages.start_index, pages.size), fields)
+            yield from records
+
+    def lookup_isbn(self, isbn):
+        """Volumes response for an ISBN (10 or 13 digits, separators allowed)"""
+        return self._cached(*isbn_request(isbn))
+
+    def lookup_isbns(self, isbns, max_workers=BATCH_WORKERS):
+        """Look up many ISBNs at once.
+
+        Duplicates (including ISBN-10/13 pairs) are fetched once, cached ISBNs
+        are answered directly and the rest are fetched concurrently with at
+        most ``max_workers`` requests in flight. Returns a dictionary mapping
+        each input value to its volumes response, or to the exception raised for it.
+        """
+        keys = {isbn: normalize_isbn(isbn) or isbn.strip() for isbn in isbns}
+        responses = {}
+        pending = []
+        for key in dict.fromkeys(keys.values()):
+            data = self.cache.get('isbn:' + key)
+            if data is not None:
+                self.counters['hits'] += 1
+                responses[key] = data
+            else:
+                pending.append(key)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, POOL_SIZE, len(pending)))) as pool:
+                futures = {key: pool.submit(self.lookup_isbn, key) for key in pending}
+                for key, future in futures.items():
+                    try:
+                        responses[key] = future.result()
+                    except Exception as e:
+                        responses[key] = e
+        return {isbn: responses[key] for isbn, key in keys.items()}
+
+    def _cached(self, key, params):
+        data = self.cache.get(key)
+        if data is not None:
+            self.counters['hits'] += 1
+            return data
+        if self.persistent_cache:
+            data = self.persistent_cache.get(key)
+            if data is not None:
+                self.counters['persistent_hits'] += 1
+                self.cache.set(key, data)
+                return data
+
+        # Coalesce identical in-flight requests: the first caller fetches, the others wait
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            self.counters['coalesced'] += 1
+            return future.result(timeout=sum(self.timeout) * 3)
+
+        try:
+            self.counters['misses'] += 1
+            data = _compact(self._fetch(params))
+            self.cache.set(key, data)
+            if self.persistent_cache:
+                self.persistent_cache.set(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            self.counters['errors'] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _fetch(self, params):
+        if self.api_key:
+            params = dict(params, key=self.api_key)
+        try:
+            with metrics.upstream_timer():
+                response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GoogleBooksError(str(e)) from e
+
+
+def create_client(config):
+    """Build a client from app.config values (falling back to environment variables)"""
+    def setting(name, default=None):
+        return config.get(name) or os.environ.get(name) or default
+
+    return GoogleBooksClient(
+        api_url=setting('GOOGLE_BOOKS_API_URL', API_URL),
+        api_key=setting('GOOGLE_BOOKS_API_KEY'),
+        cache_path=setting('GOOGLE_BOOKS_CACHE_DB'),
+        ttl=float(setting('GOOGLE_BOOKS_CACHE_TTL', CACHE_TTL)),
+    )
+
+
+def get_client():
+    """The client of the current app, created on first use"""
+    app = current_app._get_current_object()
+    client = app.extensions.get('google_books')
+    if client is None:
+        client = app.extensions.setdefault('google_books', create_client(app.config))
+    return client
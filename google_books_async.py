@@ -0,0 +1,115 @@
+"""
+Asynchronous Google Books client for the ASGI serving mode (see asgi.py).
+
+``AsyncGoogleBooksClient`` speaks to the API through one pooled
+``httpx.AsyncClient``, so a slow upstream request only parks a coroutine
+instead of holding a worker thread. It wraps the synchronous
+``GoogleBooksClient`` of the app and shares its cache tiers and counters:
+cache keys, normalization and paging are the same (``search_request()``,
+``isbn_request()``, ``SearchPages``), so both serving modes answer from and
+fill the same caches. Identical requests in flight are coalesced on the
+event loop.
+"""
+
+import asyncio
+
+import httpx
+
+import google_books
+import metrics
+from google_books import GoogleBooksError, SearchPages, VOLUME_FIELDS, MAX_PAGE_SIZE
+
+# Concurrent upstream connections; waiting requests cost no threads, so this can exceed POOL_SIZE
+MAX_CONNECTIONS = 100
+# Connection attempts retried on connect errors
+CONNECT_RETRIES = 2
+
+
+class AsyncGoogleBooksClient:
+    """Coroutine counterpart of GoogleBooksClient, sharing its caches"""
+
+    def __init__(self, client, transport=None):
+        self.client = client
+        connect, read = client.timeout
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=google_books.POOL_SIZE),
+            transport=transport or httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES),
+        )
+        self._in_flight = {}  # cache key -> asyncio.Future of the upstream response
+
+    @property
+    def counters(self):
+        return self.client.counters
+
+    async def search(self, query, start_index=0, max_results=None):
+        """Volumes response for one page of a free-text search"""
+        request = google_books.search_request(query, start_index, max_results)
+        if request is None:
+            return {}
+        return await self._cached(*request)
+
+    async def search_records(self, query, fields=VOLUME_FIELDS, start_index=0, limit=None,
+                             page_size=MAX_PAGE_SIZE):
+        """VolumeRecords for a search, paging until ``limit`` results are collected"""
+        pages = SearchPages(start_index, limit, page_size)
+        records = []
+        while pages.size:
+            records += pages.add(await self.search(query, pages.start_index, pages.size), fields)
+        return records
+
+    async def lookup_isbn(self, isbn):
+        """Volumes response for an ISBN (10 or 13 digits, separators allowed)"""
+        return await self._cached(*google_books.isbn_request(isbn))
+
+    async def _cached(self, key, params):
+        data = self.client.cache.get(key)
+        if data is not None:
+            self.counters['hits'] += 1
+            return data
+        persistent_cache = self.client.persistent_cache
+        if persistent_cache:
+            data = await asyncio.to_thread(persistent_cache.get, key)
+            if data is not None:
+                self.counters['persistent_hits'] += 1
+                self.client.cache.set(key, data)
+                return data
+
+        # Coalesce identical in-flight requests: the first caller fetches, the others await it
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(future)
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            self.counters['misses'] += 1
+            data = google_books._compact(await self._fetch(params))
+            self.client.cache.set(key, data)
+            if persistent_cache:
+                await asyncio.to_thread(persistent_cache.set, key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            self.counters['errors'] += 1
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else was waiting
+            raise
+        finally:
+            if not future.done():  # The leader was cancelled; waiters see that instead of hanging
+                future.cancel()
+            del self._in_flight[key]
+
+    async def _fetch(self, params):
+        if self.client.api_key:
+            params = dict(params, key=self.client.api_key)
+        try:
+            with metrics.upstream_timer():
+                response = await self.http.get(self.client.api_url, params=params)
+                response.raise_for_status()
+                return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise GoogleBooksError(str(e)) from e
+
+    async def aclose(self):
+        await self.http.aclose()
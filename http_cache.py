@@ -0,0 +1,138 @@
+"""
+HTTP response caching keyed on the library version.
+
+``library_version`` holds a single counter that every write path bumps with
+``bump_version()`` inside its own transaction (add, update, delete, bulk
+import, batch ISBN insert, statistics rebuilds). Cached views build their
+key from the request path, the normalized query arguments and that counter,
+so a change to the library invalidates exactly the pages rendered before it
+and nothing needs to be purged.
+
+For a ``@cached_view`` request the counter is read (one primary-key lookup),
+then:
+
+1. If the browser's ``If-None-Match`` equals the ETag derived from the key,
+   the response is ``304 Not Modified`` and the view does not run.
+2. If the rendered page is in the Flask-Caching store it is sent as is.
+3. Otherwise the view runs and its response is stored.
+
+Pages are never cached while flash messages are pending, and caching is off
+until the ``library_version`` migration has been applied. The cache backend
+is configured with the usual Flask-Caching settings (``CACHE_TYPE``
+defaults to an in-process ``SimpleCache``); ``VIEW_CACHE = False`` turns it
+off, which ``flask budget check`` does to measure the real queries.
+"""
+
+import functools
+import hashlib
+from urllib.parse import urlencode
+
+from flask import current_app, has_request_context, make_response, request, session
+from flask_caching import Cache
+from sqlalchemy import inspect
+
+from models import db, LibraryVersion
+
+# Row id of the single library_version row
+VERSION_ROW_ID = 1
+# request.environ key of the version read by the current request
+VERSION_ENVIRON_KEY = 'shelflog.library_version'
+# Seconds a rendered page stays in the cache (superseded versions just expire)
+VIEW_CACHE_TIMEOUT = 600
+
+cache = Cache()
+
+# Availability is checked once per engine (library_version table present)
+_availability = {}
+
+
+def init_app(app):
+    app.config.setdefault('CACHE_TYPE', 'SimpleCache')
+    app.config.setdefault('CACHE_DEFAULT_TIMEOUT', VIEW_CACHE_TIMEOUT)
+    app.config.setdefault('VIEW_CACHE', True)
+    cache.init_app(app)
+
+
+def is_available():
+    """Return True when the library_version table exists for the current engine"""
+    engine = db.engine
+    available = _availability.get(engine)
+    if available is None:
+        available = inspect(db.session.connection()).has_table(LibraryVersion.__tablename__)
+        _availability[engine] = available
+    return available
+
+
+def current_version():
+    """The library version, or None when it is not tracked.
+
+    Read once per request: cached_view() and the facet cache share the value.
+    """
+    # Kept in the WSGI environ: unlike g, it never outlives the request
+    if has_request_context() and VERSION_ENVIRON_KEY in request.environ:
+        return request.environ[VERSION_ENVIRON_KEY]
+    version = None
+    if is_available():
+        version = db.session.execute(
+            db.select(LibraryVersion.version).where(LibraryVersion.id == VERSION_ROW_ID)
+        ).scalar()
+    if has_request_context():
+        request.environ[VERSION_ENVIRON_KEY] = version
+    return version
+
+
+def bump_version():
+    """Invalidate every cached view; call inside the transaction that changes the library"""
+    if has_request_context():
+        request.environ.pop(VERSION_ENVIRON_KEY, None)
+    if is_available():
+        db.session.execute(
+            db.update(LibraryVersion)
+            .where(LibraryVersion.id == VERSION_ROW_ID)
+            .values(version=LibraryVersion.version + 1)
+        )
+
+
+def normalized_args():
+    """Query arguments as a canonical, URL-encoded string: sorted, empty values dropped"""
+    return urlencode(sorted((key, value) for key, values in request.args.lists() for value in values if value))
+
+
+def cached_view(extra_key=None):
+    """Cache a GET view by path, query arguments and library version.
+
+    ``extra_key`` is an optional callable returning anything else the page
+    depends on (e.g. today's date for the dashboard).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['VIEW_CACHE'] or session.get('_flashes'):
+                return view(*args, **kwargs)
+            version = current_version()
+            if version is None:
+                return view(*args, **kwargs)
+
+            key = '\0'.join((request.path, normalized_args(), str(extra_key() if extra_key else '')))
+            etag = f'{version}-{hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]}'
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                cached = cache.get('view:' + etag)
+                if cached is not None:
+                    body, mimetype = cached
+                    response = current_app.response_class(body, mimetype=mimetype)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or session.get('_flashes'):
+                        return response
+                    cache.set('view:' + etag, (response.get_data(), response.mimetype))
+
+            response.set_etag(etag)
+            # Browsers may keep the page but must revalidate it (cheap: usually a 304)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,320 @@
+"""
+Background jobs: a persistent queue in the ``job`` table and a worker pool.
+
+Request handlers hand slow work (Google Books enrichment, see
+enrichment.py) to ``enqueue()``, which inserts a ``job`` row and returns at
+once; ``GET /jobs/<id>`` reports its status and progress. Jobs are plain
+functions registered by kind with ``@handler('kind')``; they receive a
+``JobContext`` with their parameters and report progress through it.
+
+Workers claim the oldest queued job with a single conditional ``UPDATE ...
+RETURNING``, so any number of threads and processes can share the queue:
+a claim that loses a race simply matches no row. A running job refreshes
+its heartbeat whenever it reports progress; a job whose heartbeat is older
+than JOBS_STALE_AFTER (its worker was killed or the process restarted) is
+claimed again, up to MAX_ATTEMPTS runs in all, after which it is marked
+failed. Handlers should therefore commit their work in small, idempotent
+steps.
+
+Each web process runs JOBS_WORKERS threads, started on the first
+``enqueue()`` (or on the first request, when unfinished jobs are waiting
+from an earlier run), never in CLI commands. The pool suits the I/O-bound
+jobs of this app; for CPU-heavy work or more throughput, run dedicated
+worker processes with ``flask jobs work``, one or more per core.
+"""
+
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_request_context
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+# Claims of a job whose worker disappeared, counting the first run
+MAX_ATTEMPTS = 3
+# Jobs shown by 'flask jobs list'
+LIST_LIMIT = 20
+
+# kind -> function(JobContext) returning a JSON-serializable result
+HANDLERS = {}
+
+# Availability is checked once per engine (job table present)
+_availability = {}
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+
+def handler(kind):
+    """Register the decorated function as the handler of jobs of ``kind``"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def is_available():
+    """Return True when the job table exists for the current engine"""
+    engine = db.engine
+    available = _availability.get(engine)
+    if available is None:
+        # Inspect on the session's connection (see library_stats.is_available)
+        available = inspect(db.session.connection()).has_table(Job.__tablename__)
+        _availability[engine] = available
+    return available
+
+
+def enqueue(kind, params=None):
+    """Queue a job of ``kind`` (committing it); returns the Job.
+
+    Inside a request the process's workers are started and woken; jobs
+    queued from the command line wait for a ``flask jobs work`` process or
+    the next web process.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, params=params or {}, status='queued', progress=0, attempts=0,
+              created_at=datetime.now())
+    db.session.add(job)
+    db.session.commit()
+    pool = current_app.extensions.get('jobs')
+    if pool is not None and has_request_context():
+        pool.start()
+        pool.wake()
+    return job
+
+
+def describe(job):
+    """JSON view of a job for the /jobs/<id> endpoint"""
+    def timestamp(value):
+        return value.isoformat(timespec='seconds') if value else None
+
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': min(100, job.progress * 100 // job.total) if job.total else None,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': timestamp(job.created_at),
+        'started_at': timestamp(job.started_at),
+        'finished_at': timestamp(job.finished_at),
+    }
+
+
+class JobContext:
+    """What a handler sees of its job: the parameters and progress reporting.
+
+    Progress updates run on the handler's session, so they commit together
+    with the work they describe.
+    """
+
+    def __init__(self, job_id, kind, params):
+        self.id = job_id
+        self.kind = kind
+        self.params = params or {}
+
+    def _update(self, **values):
+        db.session.execute(
+            db.update(Job).where(Job.id == self.id).values(heartbeat_at=datetime.now(), **values)
+        )
+
+    def set_total(self, total):
+        """Set the number of items the job will process, restarting progress at 0.
+
+        A reclaimed job calls this again for the items still left, so the
+        progress of the abandoned run is discarded with its total.
+        """
+        self._update(total=total, progress=0)
+
+    def advance(self, count=1):
+        """Mark ``count`` more items done and refresh the heartbeat"""
+        self._update(progress=Job.progress + count)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:100]
+
+
+def claim(worker, stale_after):
+    """Mark the oldest claimable job as running by ``worker``; returns a JobContext or None"""
+    now = datetime.now()
+    stale = db.and_(Job.status == 'running', Job.heartbeat_at < now - timedelta(seconds=stale_after))
+    # Give up on jobs whose workers keep disappearing
+    db.session.execute(
+        db.update(Job)
+        .where(stale, Job.attempts >= MAX_ATTEMPTS)
+        .values(status='failed', finished_at=now, error=f'Abandoned by its worker {MAX_ATTEMPTS} times')
+        .execution_options(synchronize_session=False)
+    )
+    claimable = db.or_(Job.status == 'queued', db.and_(stale, Job.attempts < MAX_ATTEMPTS))
+    oldest = db.select(Job.id).where(claimable).order_by(Job.id).limit(1).scalar_subquery()
+    # Repeating the condition makes the claim atomic: of two workers that
+    # picked the same id, the second updates no row
+    statement = (
+        db.update(Job)
+        .where(Job.id == oldest, claimable)
+        .values(status='running', worker=worker, started_at=now, heartbeat_at=now,
+                attempts=Job.attempts + 1)
+        .returning(Job.id, Job.kind, Job.params)
+        .execution_options(synchronize_session=False)
+    )
+    row = db.session.execute(statement).first()
+    db.session.commit()
+    return JobContext(*row) if row else None
+
+
+def _finish(job_id, **values):
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(finished_at=datetime.now(), **values))
+    db.session.commit()
+
+
+def run(job):
+    """Run a claimed job and record its outcome"""
+    try:
+        result = HANDLERS[job.kind](job)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job.id, job.kind)
+        _finish(job.id, status='failed', error=f'{type(e).__name__}: {e}')
+        return
+    _finish(job.id, status='done', result=result)
+
+
+def work_once(stale_after):
+    """Claim and run one job; returns False when the queue was empty"""
+    job = claim(worker_name(), stale_after)
+    if job is None:
+        return False
+    run(job)
+    return True
+
+
+class WorkerPool:
+    """Daemon threads draining the queue for one app"""
+
+    def __init__(self, app, size, poll_interval, stale_after):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.threads = []
+        self.resume_checked = False
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the threads (once)"""
+        if self.threads or self.size <= 0:
+            return
+        with self._lock:
+            if self.threads:
+                return
+            for number in range(self.size):
+                thread = threading.Thread(target=self._loop, name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def wake(self):
+        """Make idle workers check the queue now"""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Let the workers finish their current job and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                # A fresh app context (and session) per job
+                with self.app.app_context():
+                    ran = work_once(self.stale_after)
+            except Exception:
+                logger.exception('Job worker error')
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+def _resume_pending():
+    # First request of the process: start the workers if jobs are waiting from an earlier run
+    pool = current_app.extensions['jobs']
+    if pool.resume_checked:
+        return
+    pool.resume_checked = True
+    if is_available() and db.session.query(Job.id).filter(Job.status.in_(('queued', 'running'))).first():
+        pool.start()
+
+
+def init_app(app):
+    """Create the worker pool of ``app``; threads start with the first job"""
+    app.config.setdefault('JOBS_WORKERS', 2)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 2)
+    app.config.setdefault('JOBS_STALE_AFTER', 300)
+    app.extensions['jobs'] = WorkerPool(app, app.config['JOBS_WORKERS'], app.config['JOBS_POLL_INTERVAL'],
+                                        app.config['JOBS_STALE_AFTER'])
+    if app.config['JOBS_WORKERS'] > 0:
+        app.before_request(_resume_pending)
+
+
+# --- CLI ---
+
+def _require_table():
+    if not is_available():
+        raise click.ClickException('Job table not found; run "flask db upgrade" first.')
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, help='Worker threads (default: JOBS_WORKERS, at least 1).')
+@click.option('--drain', is_flag=True, help='Exit once the queue is empty instead of waiting for jobs.')
+def work_command(workers, drain):
+    """Run jobs from the queue in this process until interrupted."""
+    _require_table()
+    app = current_app._get_current_object()
+    stale_after = app.config['JOBS_STALE_AFTER']
+    if drain:
+        done = 0
+        while work_once(stale_after):
+            done += 1
+        click.echo(f'Ran {done} job(s); the queue is empty.')
+        return
+
+    pool = WorkerPool(app, max(1, workers or app.config['JOBS_WORKERS']), app.config['JOBS_POLL_INTERVAL'],
+                      stale_after)
+    pool.start()
+    click.echo(f'{pool.size} worker(s) waiting for jobs (Ctrl+C to stop).')
+    try:
+        while True:
+            threading.Event().wait(3600)
+    except KeyboardInterrupt:
+        click.echo('Stopping after the current jobs...')
+        pool.stop()
+
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(STATUSES), help='Only jobs with this status.')
+def list_command(status):
+    """Show the most recent jobs."""
+    _require_table()
+    query = db.session.query(Job).order_by(Job.id.desc())
+    if status:
+        query = query.filter(Job.status == status)
+    for job in query.limit(LIST_LIMIT):
+        progress = f'{job.progress}/{job.total}' if job.total is not None else str(job.progress)
+        click.echo(f'{job.id:>6} {job.kind:<16} {job.status:<8} {progress:>11}  {job.error or ""}')
@@ -0,0 +1,260 @@
+"""
+Declarative filters and sort keys of the library listing.
+
+``index()``, ``load_more_books()`` and ``search_books_page()`` describe what
+they list with a ``Listing``: the search text, the active filters and a sort
+key, validated once against SORTS and FILTERS. Adding a sort key is one
+SORTS entry (plus a button in the templates); adding a filter is one
+FILTERS entry.
+
+Listing statements are built once per query *shape*, that is the search
+mode, the set of active filters, the sort key and the order, and kept in
+``_statements``. Every value that differs between requests (the search
+terms, filter values, LIMIT/OFFSET and the keyset cursor) is a named bound
+parameter supplied at execution. Reusing the same ``Select`` object means a
+repeated request skips building the statement and computing its cache key
+(SQLAlchemy memoizes the key on the object) and goes straight to the
+compiled SQL in the engine's compiled cache.
+
+``Listing.apply_filters()`` adds the same search and filters to any Book
+query, for the facet counts in facets.py.
+"""
+
+from datetime import date
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import defer, selectinload, with_expression
+
+from models import db, Book, Genre
+import search_index
+
+# Characters of notes loaded for list views (cards show 60, search results 80)
+NOTES_PREVIEW_LENGTH = 81
+
+
+def notes_preview_options():
+    """Defer the notes blob and load only its first characters as notes_preview"""
+    return (
+        defer(Book.notes),
+        with_expression(Book.notes_preview, db.func.substr(Book.notes, 1, NOTES_PREVIEW_LENGTH)),
+    )
+
+
+def card_options():
+    """Loader options for book cards: genres in one IN query, notes as a preview"""
+    return (selectinload(Book.genres),) + notes_preview_options()
+
+
+# What each view loads with the books: index cards or search results
+LOADERS = {
+    'cards': card_options,
+    'results': notes_preview_options,
+}
+
+
+class SortKey:
+    """A sort column; Book.id breaks ties so keyset pagination sees a total order.
+
+    NULLs come first in ascending and last in descending order on every
+    backend (SQLite's default; PostgreSQL's is the reverse), which is what
+    book_queries.keyset_page() relies on when it crosses the NULL rows.
+    """
+
+    def __init__(self, column, default_order='asc'):
+        self.column = column
+        self.default_order = default_order
+        tiebreak = () if column is Book.id else (Book.id,)
+        first, last = (column.asc(), column.desc()) if not self.nullable else (
+            column.asc().nulls_first(), column.desc().nulls_last())
+        self.order_by = {
+            'asc': (first,) + tuple(expression.asc() for expression in tiebreak),
+            'desc': (last,) + tuple(expression.desc() for expression in tiebreak),
+        }
+
+    @property
+    def nullable(self):
+        return Book.__table__.c[self.column.key].nullable
+
+    def cursor_value(self, book):
+        """The sort value of ``book`` as stored in a cursor (JSON)"""
+        value = getattr(book, self.column.key)
+        return value.isoformat() if isinstance(value, date) else value
+
+    def seek_value(self, value):
+        """A cursor value back as a bind parameter value"""
+        if value is not None and isinstance(self.column.type, db.Date):
+            return date.fromisoformat(value)
+        return value
+
+
+# Values accepted by the sort parameter; 'date' uses the id as a proxy for date added
+SORTS = {
+    'title': SortKey(Book.title),
+    'author': SortKey(Book.author),
+    'rating': SortKey(Book.rating, 'desc'),
+    'date': SortKey(Book.id, 'desc'),
+    'status': SortKey(Book.status),
+    'finished': SortKey(Book.finish_date, 'desc'),
+    'progress': SortKey(Book.progress_pct, 'desc'),
+}
+SORT_KEYS = tuple(SORTS)
+SORT_ORDERS = ('asc', 'desc')
+# Best match first; only with a search the full-text index can rank (title order otherwise)
+RELEVANCE = 'relevance'
+
+
+class Filter:
+    """A listing filter: ``criterion`` compares a column with the ``filter_<name>`` parameter"""
+
+    def __init__(self, criterion, parse=str, join=None):
+        self.criterion = criterion
+        self.parse = parse
+        self.join = join
+
+    def value(self, raw):
+        """The parameter value for a request argument, or None when the filter is off"""
+        if raw in (None, '', 'all'):
+            return None
+        try:
+            return self.parse(raw)
+        except ValueError:
+            return None  # Ignore invalid values
+
+
+FILTERS = {
+    'genre': Filter(Genre.name == db.bindparam('filter_genre', type_=db.String), join=Book.genres),
+    'rating': Filter(Book.rating == db.bindparam('filter_rating', type_=db.Integer), parse=int),
+    'format': Filter(Book.format == db.bindparam('filter_format', type_=db.String)),
+    # Reading progress range in percent, inclusive ("almost finished": 90 to 99)
+    'progress_min': Filter(Book.progress_pct >= db.bindparam('filter_progress_min', type_=db.Integer), parse=int),
+    'progress_max': Filter(Book.progress_pct <= db.bindparam('filter_progress_max', type_=db.Integer), parse=int),
+}
+
+# Prebuilt statements: (dialect, variant, loader, shape) -> Select
+_statements = {}
+
+
+class Listing:
+    """Validated search, filter and sort parameters of one listing request"""
+
+    def __init__(self, search='', filters=None, sort='title', order=None, default_order=None):
+        self.search = search or ''
+        self.search_mode, self.search_value = (
+            search_index.search_terms(self.search) if self.search else (None, None))
+        self.filters = {}
+        for name, raw in (filters or {}).items():
+            value = FILTERS[name].value(raw)
+            if value is not None:
+                self.filters[name] = value
+
+        if sort == RELEVANCE and self.search_mode in ('fts5', 'tsvector'):
+            self.sort = RELEVANCE
+            self.order = 'desc'
+        else:
+            self.sort = sort if sort in SORTS else 'title'
+            self.order = order if order in SORT_ORDERS else (default_order or SORTS[self.sort].default_order)
+
+    @classmethod
+    def from_args(cls, args, default_order=None):
+        """The listing described by the query string of index() and load_more_books()"""
+        return cls(search=args.get('search', ''),
+                   filters={name: args.get(name, '') for name in FILTERS},
+                   sort=args.get('sort', 'title'),
+                   order=args.get('order'),
+                   default_order=default_order)
+
+    @property
+    def sort_key(self):
+        """The SortKey, or None for relevance (which cannot be seeked)"""
+        return SORTS.get(self.sort)
+
+    @property
+    def shape(self):
+        """Everything the SQL depends on; values go in params()"""
+        return self.search_mode, tuple(sorted(self.filters)), self.sort, self.order
+
+    def params(self, **extra):
+        """Bound parameter values of this listing's statements"""
+        params = {f'filter_{name}': value for name, value in self.filters.items()}
+        if self.search_mode:
+            params[search_index.SEARCH_PARAM] = self.search_value
+        params.update(extra)
+        return params
+
+    def _where(self, query, rank=False):
+        # Search (FTS5 index when available, LIKE fallback otherwise), then the filters
+        if self.search_mode:
+            query = search_index.apply_search_mode(query, self.search_mode, rank=rank)
+        for name, spec in FILTERS.items():
+            if name in self.filters:
+                if spec.join is not None:
+                    query = query.join(spec.join)
+                query = query.filter(spec.criterion)
+        return query
+
+    def apply_filters(self, query):
+        """Restrict a query that selects from Book to this listing's search and filters"""
+        return self._where(query).params(self.params())
+
+    def _build(self, variant, loader):
+        if variant == 'count':
+            return self._where(select(db.func.count()).select_from(Book))
+
+        statement = self._where(select(Book).options(*LOADERS[loader]()), rank=(self.sort == RELEVANCE))
+        sort_key = self.sort_key
+        if sort_key is not None:
+            statement = statement.order_by(*sort_key.order_by[self.order])
+        if variant == 'all':
+            return statement
+
+        column = sort_key.column if sort_key is not None else None
+        last_id = db.bindparam('seek_id', type_=db.Integer)
+        if variant == 'after_id':
+            statement = statement.filter(Book.id < last_id if self.order == 'desc' else Book.id > last_id)
+        elif variant == 'after':
+            position = tuple_(db.bindparam('seek_value', type_=column.type), last_id)
+            key = tuple_(column, Book.id)
+            statement = statement.filter(key < position if self.order == 'desc' else key > position)
+        elif variant == 'null_tail':
+            statement = statement.filter(column.is_(None))
+
+        statement = statement.limit(db.bindparam('listing_limit', type_=db.Integer))
+        if variant == 'page':
+            statement = statement.offset(db.bindparam('listing_offset', type_=db.Integer))
+        return statement
+
+    def statement(self, variant='page', loader='cards'):
+        """The prebuilt statement of this shape.
+
+        ``variant`` is 'page' (listing_limit and listing_offset), 'after_id'
+        or 'after' (keyset seeks after seek_id, or (seek_value, seek_id)),
+        'null_tail' (rows with a NULL sort value), 'all' or 'count'.
+        """
+        key = (db.engine.dialect.name, variant, loader, self.shape)
+        statement = _statements.get(key)
+        if statement is None:
+            statement = _statements[key] = self._build(variant, loader)
+        return statement
+
+    def fetch(self, variant='page', loader='cards', **params):
+        """Books of one statement variant (see statement())"""
+        return db.session.execute(self.statement(variant, loader), self.params(**params)).scalars().all()
+
+    def count(self):
+        return db.session.execute(self.statement('count'), self.params()).scalar()
+
+    def paginate(self, page, per_page, error_out=False):
+        """Numbered pagination (LIMIT/OFFSET plus a COUNT(*)), like Query.paginate()"""
+        return ListingPagination(page=page, per_page=per_page, error_out=error_out, listing=self)
+
+
+class ListingPagination(Pagination):
+    """Flask-SQLAlchemy pagination over a Listing's prebuilt page and count statements"""
+
+    def _query_items(self):
+        return self._query_args['listing'].fetch(
+            'page', listing_limit=self.per_page, listing_offset=self._query_offset)
+
+    def _query_count(self):
+        return self._query_args['listing'].count()
@@ -0,0 +1,200 @@
+"""
+Load test of the serving modes with an artificially slow Google Books.
+
+``python -m loadtest`` starts the stub volumes endpoint of the benchmarks
+package (answering after ``--delay`` seconds), then serves the app twice on
+a local port:
+
+* ``sync``: the Flask app on a WSGI server with ``--workers`` threads, the
+  way a pool of synchronous workers serves it;
+* ``async``: ``asgi.application`` under uvicorn with the same number of
+  threads for the Flask routes.
+
+In each mode the local pages (``/`` and ``/dashboard``) are timed once on an
+idle server and once while ``--slow`` clients keep uncached ``/api/search``
+requests in flight. In sync mode the slow requests occupy every worker and
+local pages queue behind them; in async mode they should keep their idle
+latency. Requires the optional ``uvicorn`` and ``httpx`` packages.
+
+This is test tooling, not part of the application: it imports the app (and
+the ASGI server) only when run, and app.py never imports it.
+"""
+
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import click
+import requests
+
+from benchmarks import upstream as stub_upstream
+
+LOCAL_PAGES = ('/', '/dashboard')
+# Seconds the stub upstream waits before answering
+UPSTREAM_DELAY = 2.0
+SLOW_CLIENTS = 16
+WORKERS = 4
+SAMPLES = 20
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI server handling requests on a fixed number of threads, like sync workers"""
+
+    def __init__(self, address, app, workers):
+        super().__init__(address, QuietHandler)
+        self.set_app(app)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_sync(app, port, workers):
+    server = PooledWSGIServer(('127.0.0.1', port), app, workers)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+        server.server_close()
+    return stop
+
+
+def _start_async(app, port, workers):
+    import uvicorn
+    from asgi import AsyncApp
+
+    config = uvicorn.Config(AsyncApp(app, threads=workers), host='127.0.0.1', port=port,
+                            log_level='warning', lifespan='on')
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=10)
+    return stop
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _time_pages(base_url, samples):
+    """{page: [seconds]} for ``samples`` sequential requests per local page"""
+    timings = {page: [] for page in LOCAL_PAGES}
+    with requests.Session() as session:
+        for _ in range(samples):
+            for page in LOCAL_PAGES:
+                started = time.perf_counter()
+                session.get(base_url + page, timeout=120).raise_for_status()
+                timings[page].append(time.perf_counter() - started)
+    return timings
+
+
+def run_mode(app, mode, workers, slow_clients, samples):
+    """Idle and loaded local-page timings of one serving mode"""
+    port = _free_port()
+    stop = (_start_async if mode == 'async' else _start_sync)(app, port, workers)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _time_pages(base_url, 2)  # Warm up caches and connections
+        idle = _time_pages(base_url, samples)
+
+        done = threading.Event()
+        queries = count()
+        slow_counts = []
+
+        def slow_client():
+            sent = 0
+            with requests.Session() as session:
+                while not done.is_set():
+                    # A new query every time, so neither the cache nor coalescing answers it
+                    session.get(f'{base_url}/api/search', params={'q': f'slow-{mode}-{next(queries)}'}, timeout=120)
+                    sent += 1
+            slow_counts.append(sent)
+
+        slow_threads = [threading.Thread(target=slow_client, daemon=True) for _ in range(slow_clients)]
+        for thread in slow_threads:
+            thread.start()
+        time.sleep(0.5)  # Let the slow requests occupy the server
+        loaded = _time_pages(base_url, samples)
+        done.set()
+        for thread in slow_threads:
+            thread.join()
+        return idle, loaded, sum(slow_counts)
+    finally:
+        stop()
+
+
+@click.command()
+@click.option('--mode', 'modes', type=click.Choice(['sync', 'async']), multiple=True,
+              help='Serving mode to test (default: both).')
+@click.option('--delay', default=UPSTREAM_DELAY, show_default=True, help='Seconds the stub upstream takes to answer.')
+@click.option('--slow', 'slow_clients', default=SLOW_CLIENTS, show_default=True,
+              help='Clients keeping upstream searches in flight.')
+@click.option('--workers', default=WORKERS, show_default=True, help='Worker threads serving the Flask routes.')
+@click.option('--samples', default=SAMPLES, show_default=True, help='Timed requests per local page and phase.')
+def main(modes, delay, slow_clients, workers, samples):
+    """Compare local-page latency of the sync and async modes under a slow upstream."""
+    from app import app
+
+    with app.app_context():
+        _run(app, modes, delay, slow_clients, workers, samples)
+
+
+def _run(app, modes, delay, slow_clients, workers, samples):
+    upstream = stub_upstream.start(delay)
+
+    # Point the Google Books client at the stub for the duration of the test
+    previous = app.config.get('GOOGLE_BOOKS_API_URL'), app.extensions.pop('google_books', None)
+    app.config['GOOGLE_BOOKS_API_URL'] = upstream.url
+    click.echo(f'Upstream delay {delay}s, {slow_clients} slow clients, {workers} workers, {samples} samples per page.')
+    click.echo(f"{'mode':<6} {'page':<11} {'idle p50':>9} {'idle p95':>9} {'loaded p50':>11} {'loaded p95':>11}")
+    try:
+        for mode in modes or ('sync', 'async'):
+            idle, loaded, slow_requests = run_mode(app, mode, workers, slow_clients, samples)
+            for page in LOCAL_PAGES:
+                click.echo(
+                    f'{mode:<6} {page:<11} '
+                    f'{statistics.median(idle[page]) * 1000:>7.1f}ms {_percentile(idle[page], 0.95) * 1000:>7.1f}ms '
+                    f'{statistics.median(loaded[page]) * 1000:>9.1f}ms {_percentile(loaded[page], 0.95) * 1000:>9.1f}ms'
+                )
+            click.echo(f'{mode:<6} upstream searches completed while loaded: {slow_requests}')
+    finally:
+        upstream.shutdown()
+        app.config['GOOGLE_BOOKS_API_URL'], client = previous
+        app.extensions.pop('google_books', None)
+        if client is not None:
+            app.extensions['google_books'] = client
+
+
+if __name__ == '__main__':
+    main()
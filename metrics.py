@@ -0,0 +1,286 @@
+"""
+Request instrumentation and a Prometheus ``/metrics`` endpoint.
+
+``init_app()`` times every request and records, per route:
+
+- latency (``shelflog_request_duration_seconds`` histogram) and a request
+  count by status code;
+- SQL statements and total database time, measured with SQLAlchemy's
+  ``before_cursor_execute``/``after_cursor_execute`` events on every engine
+  (the read replica included);
+- template render time, from Flask's ``before_render_template`` and
+  ``template_rendered`` signals.
+
+The Google Books client reports each upstream call through
+``upstream_timer()`` (latency by outcome), and its cache counters are read
+at scrape time, so hits, misses and the hit ratio need no extra bookkeeping.
+The async routes of asgi.py record their latency with ``observe_request()``.
+
+``GET /metrics`` returns everything in the Prometheus text format. Metrics
+live in process memory: with several worker processes each one reports its
+own, so scrape the workers individually or aggregate in Prometheus. With
+``SERVER_TIMING`` enabled every response also carries a ``Server-Timing``
+header (``app``, ``db``, ``tpl`` and ``gbooks`` durations) that the
+browser's developer tools display for the request.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram buckets: seconds (the Prometheus client defaults) and statements per request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Route label of requests that matched no URL rule (keeps 404 scans from adding series)
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family with a fixed set of labels"""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> state
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, state in series:
+            lines.extend(self._samples(key, state))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        yield f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * len(self.buckets), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+
+    def _samples(self, key, state):
+        counts, total = state
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        labels = _format_labels(self.labelnames, key)
+        yield f'{self.name}_sum{labels} {_format_value(total)}'
+        yield f'{self.name}_count{labels} {cumulative}'
+
+
+REQUEST_LATENCY = Histogram(
+    'shelflog_request_duration_seconds', 'Time spent handling a request.', ('route', 'method'))
+REQUESTS = Counter(
+    'shelflog_requests', 'Requests handled, by response status.', ('route', 'method', 'status'))
+REQUEST_STATEMENTS = Histogram(
+    'shelflog_request_sql_statements', 'SQL statements executed per request.', ('route',), STATEMENT_BUCKETS)
+REQUEST_DB_TIME = Histogram(
+    'shelflog_request_db_seconds', 'Time spent executing SQL per request.', ('route',))
+REQUEST_TEMPLATE_TIME = Histogram(
+    'shelflog_request_template_seconds', 'Time spent rendering templates per request.', ('route',))
+UPSTREAM_LATENCY = Histogram(
+    'shelflog_google_books_request_seconds', 'Google Books API calls, by outcome (ok or error).', ('outcome',))
+
+REGISTRY = [REQUEST_LATENCY, REQUESTS, REQUEST_STATEMENTS, REQUEST_DB_TIME, REQUEST_TEMPLATE_TIME,
+            UPSTREAM_LATENCY]
+
+
+class RequestStats:
+    """Timings collected while one request is handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.upstream_time = 0.0
+        self._template_starts = []
+
+
+def _current_stats():
+    return g.get('request_metrics') if has_request_context() else None
+
+
+def observe_request(route, method, status, seconds):
+    """Record one handled request (also used by the async routes of asgi.py)"""
+    REQUEST_LATENCY.observe(seconds, route=route, method=method)
+    REQUESTS.inc(route=route, method=method, status=status)
+
+
+@contextmanager
+def upstream_timer():
+    """Time one Google Books API call; an exception leaving the block counts as an error"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_LATENCY.observe(elapsed, outcome=outcome)
+        stats = _current_stats()
+        if stats is not None:
+            stats.upstream_time += elapsed
+
+
+# --- HOOKS ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Statements on one connection do not nest; a failed one is simply overwritten by the next
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_query_start', None)
+    stats = _current_stats()
+    if stats is not None and started is not None:
+        stats.statements += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _before_render_template(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats._template_starts.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats._template_starts:
+        stats.template_time += time.perf_counter() - stats._template_starts.pop()
+
+
+def _start_request():
+    g.request_metrics = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('request_metrics', None)
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    route = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+    observe_request(route, request.method, response.status_code, elapsed)
+    REQUEST_STATEMENTS.observe(stats.statements, route=route)
+    REQUEST_DB_TIME.observe(stats.db_time, route=route)
+    REQUEST_TEMPLATE_TIME.observe(stats.template_time, route=route)
+
+    if current_app.config['SERVER_TIMING']:
+        timings = [
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+        ]
+        if stats.upstream_time:
+            timings.append(f'gbooks;dur={stats.upstream_time * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+
+# --- EXPOSITION ---
+
+def _google_books_lines(app):
+    """Cache counters of the app's Google Books client, read at scrape time"""
+    client = app.extensions.get('google_books')
+    counters = dict(client.counters) if client is not None else {}
+    name = 'shelflog_google_books_cache_lookups'
+    lines = [f'# HELP {name} Google Books lookups, by how they were answered.', f'# TYPE {name} counter']
+    for result in ('hits', 'persistent_hits', 'coalesced', 'misses', 'errors'):
+        lines.append(f'{name}_total{{result="{result}"}} {counters.get(result, 0)}')
+
+    # Lookups answered without a request of their own, out of all lookups
+    answered = counters.get('hits', 0) + counters.get('persistent_hits', 0) + counters.get('coalesced', 0)
+    total = answered + counters.get('misses', 0)
+    ratio_name = 'shelflog_google_books_cache_hit_ratio'
+    lines += [
+        f'# HELP {ratio_name} Share of Google Books lookups answered from cache or a coalesced request.',
+        f'# TYPE {ratio_name} gauge',
+        f'{ratio_name} {_format_value(answered / total if total else 0.0)}',
+    ]
+    return lines
+
+
+def render():
+    """All metrics of this process in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    lines.extend(_google_books_lines(current_app))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_response():
+    """The ``/metrics`` response"""
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+def init_app(app, db):
+    """Instrument the requests of ``app`` and the engines of ``db``"""
+    app.config.setdefault('SERVER_TIMING', False)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
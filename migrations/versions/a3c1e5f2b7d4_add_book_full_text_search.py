@@ -0,0 +1,103 @@
+"""Add book full-text search
+
+Revision ID: a3c1e5f2b7d4
+Revises: 59824f09d717
+Create Date: 2026-10-17 09:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1e5f2b7d4'
+down_revision = '59824f09d717'
+branch_labels = None
+depends_on = None
+
+
+GENRES_FOR_BOOK = (
+    "SELECT coalesce(group_concat(genre.name, ' '), '') FROM genre "
+    "JOIN book_genre ON book_genre.genre_id = genre.id "
+    "WHERE book_genre.book_id = {book_id}"
+)
+
+TRIGGERS = {
+    'book_fts_ai': (
+        "CREATE TRIGGER book_fts_ai AFTER INSERT ON book BEGIN "
+        "INSERT INTO book_fts (rowid, title, author, notes, genres) "
+        "VALUES (new.id, new.title, new.author, coalesce(new.notes, ''), ''); "
+        "END"
+    ),
+    'book_fts_au': (
+        "CREATE TRIGGER book_fts_au AFTER UPDATE OF title, author, notes ON book BEGIN "
+        "UPDATE book_fts SET title = new.title, author = new.author, notes = coalesce(new.notes, '') "
+        "WHERE rowid = new.id; "
+        "END"
+    ),
+    'book_fts_ad': (
+        "CREATE TRIGGER book_fts_ad AFTER DELETE ON book BEGIN "
+        "DELETE FROM book_fts WHERE rowid = old.id; "
+        "END"
+    ),
+    'book_genre_fts_ai': (
+        "CREATE TRIGGER book_genre_fts_ai AFTER INSERT ON book_genre BEGIN "
+        "UPDATE book_fts SET genres = (" + GENRES_FOR_BOOK.format(book_id='new.book_id') + ") "
+        "WHERE rowid = new.book_id; "
+        "END"
+    ),
+    'book_genre_fts_ad': (
+        "CREATE TRIGGER book_genre_fts_ad AFTER DELETE ON book_genre BEGIN "
+        "UPDATE book_fts SET genres = (" + GENRES_FOR_BOOK.format(book_id='old.book_id') + ") "
+        "WHERE rowid = old.book_id; "
+        "END"
+    ),
+    'genre_fts_au': (
+        "CREATE TRIGGER genre_fts_au AFTER UPDATE OF name ON genre BEGIN "
+        "UPDATE book_fts SET genres = (" + GENRES_FOR_BOOK.format(book_id='book_fts.rowid') + ") "
+        "WHERE rowid IN (SELECT book_id FROM book_genre WHERE genre_id = new.id); "
+        "END"
+    ),
+}
+
+
+def fts5_available(bind):
+    """Probe for the FTS5 module; older or stripped SQLite builds lack it"""
+    if bind.dialect.name != 'sqlite':
+        return False
+    try:
+        bind.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        bind.exec_driver_sql("DROP TABLE temp.fts5_probe")
+    except sa.exc.OperationalError:
+        return False
+    return True
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not fts5_available(bind):
+        # The application falls back to LIKE searches without the index
+        return
+
+    op.execute(
+        "CREATE VIRTUAL TABLE book_fts USING fts5("
+        "title, author, notes, genres, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    for ddl in TRIGGERS.values():
+        op.execute(ddl)
+
+    # Backfill existing books
+    op.execute(
+        "INSERT INTO book_fts (rowid, title, author, notes, genres) "
+        "SELECT book.id, book.title, book.author, coalesce(book.notes, ''), ("
+        + GENRES_FOR_BOOK.format(book_id='book.id') + ") FROM book"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS book_fts")
@@ -0,0 +1,38 @@
+"""Add computed reading progress column
+
+Revision ID: a8d3f6c2e1b9
+Revises: e6b1d4f8a2c7
+Create Date: 2026-10-17 17:36:51.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f6c2e1b9'
+down_revision = 'e6b1d4f8a2c7'
+branch_labels = None
+depends_on = None
+
+
+# Whole percent of total_pages read, 0-100 (same expression as models.PROGRESS_PCT_SQL)
+PROGRESS_PCT_SQL = (
+    "CASE WHEN total_pages > 0 AND pages_read >= total_pages THEN 100 "
+    "WHEN total_pages > 0 AND pages_read > 0 THEN pages_read * 100 / total_pages "
+    "ELSE 0 END"
+)
+
+
+def upgrade():
+    # A generated column computes every existing row as well, so no backfill
+    # pass is needed: SQLite adds it as VIRTUAL (ADD COLUMN cannot add STORED
+    # columns; the index below stores the values), PostgreSQL as STORED,
+    # rewriting the table once.
+    op.add_column('book', sa.Column('progress_pct', sa.Integer(), sa.Computed(PROGRESS_PCT_SQL)))
+    op.create_index('ix_book_progress_pct', 'book', ['progress_pct'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_book_progress_pct', table_name='book')
+    op.drop_column('book', 'progress_pct')
@@ -0,0 +1,116 @@
+"""Add materialized library statistics
+
+Revision ID: b7e2d9a41c06
+Revises: a3c1e5f2b7d4
+Create Date: 2026-10-17 11:40:05.618230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d9a41c06'
+down_revision = 'a3c1e5f2b7d4'
+branch_labels = None
+depends_on = None
+
+
+COUNTER_COLUMNS = [
+    'total_books', 'finished', 'reading', 'to_read',
+    'physical_count', 'ebook_count', 'audiobook_count',
+    'rating_sum', 'high_rated', 'total_pages_read', 'total_pages', 'books_with_pages',
+    'finished_dated', 'days_to_complete_sum', 'days_to_complete_count',
+] + [f'weekday_{day}' for day in range(7)]
+
+HAS_DATES = "finish_date IS NOT NULL AND start_date IS NOT NULL"
+
+# Date expressions per backend; the rest of the backfill is portable SQL
+DATE_SQL = {
+    'sqlite': {
+        'days': "CAST(julianday(finish_date) - julianday(start_date) AS INTEGER)",
+        'weekday': "strftime('%w', finish_date)",
+        'month': "strftime('%Y-%m', finish_date)",
+    },
+    'postgresql': {
+        'days': "(finish_date - start_date)",
+        'weekday': "CAST(CAST(EXTRACT(DOW FROM finish_date) AS INTEGER) AS TEXT)",
+        'month': "to_char(finish_date, 'YYYY-MM')",
+    },
+}
+
+
+def backfill_expressions(date_sql):
+    expressions = {
+        'total_books': "count(id)",
+        'finished': "sum(CASE WHEN status = 'Finished' THEN 1 ELSE 0 END)",
+        'reading': "sum(CASE WHEN status = 'Reading' THEN 1 ELSE 0 END)",
+        'to_read': "sum(CASE WHEN status = 'To Read' THEN 1 ELSE 0 END)",
+        'physical_count': "sum(CASE WHEN format = 'Physical' THEN 1 ELSE 0 END)",
+        'ebook_count': "sum(CASE WHEN format = 'E-Book' THEN 1 ELSE 0 END)",
+        'audiobook_count': "sum(CASE WHEN format = 'Audiobook' THEN 1 ELSE 0 END)",
+        'rating_sum': "sum(coalesce(rating, 0))",
+        'high_rated': "sum(CASE WHEN rating >= 4 THEN 1 ELSE 0 END)",
+        'total_pages_read': "sum(coalesce(pages_read, 0))",
+        'total_pages': "sum(CASE WHEN total_pages > 0 THEN total_pages ELSE 0 END)",
+        'books_with_pages': "sum(CASE WHEN total_pages > 0 THEN 1 ELSE 0 END)",
+        'finished_dated': "sum(CASE WHEN finish_date IS NOT NULL THEN 1 ELSE 0 END)",
+        'days_to_complete_sum': f"sum(CASE WHEN {HAS_DATES} THEN {date_sql['days']} ELSE 0 END)",
+        'days_to_complete_count': f"sum(CASE WHEN {HAS_DATES} THEN 1 ELSE 0 END)",
+    }
+    expressions.update({
+        f'weekday_{day}': f"sum(CASE WHEN {date_sql['weekday']} = '{day}' THEN 1 ELSE 0 END)"
+        for day in range(7)
+    })
+    return expressions
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('library_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    *[sa.Column(name, sa.Integer(), nullable=False, server_default='0') for name in COUNTER_COLUMNS],
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('genre_stats',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('book_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+    sa.PrimaryKeyConstraint('genre_id')
+    )
+    op.create_table('month_stats',
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('finished', sa.Integer(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('month')
+    )
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_finish_date'), ['finish_date'], unique=False)
+
+    # ### end Alembic commands ###
+
+    # Backfill from the existing books
+    date_sql = DATE_SQL[op.get_bind().dialect.name]
+    backfill = backfill_expressions(date_sql)
+    columns = ', '.join(COUNTER_COLUMNS)
+    expressions = ', '.join(f"coalesce({backfill[name]}, 0)" for name in COUNTER_COLUMNS)
+    op.execute(f"INSERT INTO library_stats (id, {columns}) SELECT 1, {expressions} FROM book")
+    op.execute(
+        "INSERT INTO month_stats (month, finished) "
+        f"SELECT {date_sql['month']}, count(id) FROM book "
+        f"WHERE finish_date IS NOT NULL GROUP BY {date_sql['month']}"
+    )
+    op.execute(
+        "INSERT INTO genre_stats (genre_id, book_count) "
+        "SELECT genre_id, count(book_id) FROM book_genre GROUP BY genre_id"
+    )
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_finish_date'))
+
+    op.drop_table('month_stats')
+    op.drop_table('genre_stats')
+    op.drop_table('library_stats')
+    # ### end Alembic commands ###
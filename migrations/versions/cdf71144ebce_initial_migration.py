@@ -16,7 +16,38 @@ branch_labels = None
 depends_on = None
 
 
+def create_base_tables():
+    """Create the tables that predate the migrations, for a brand-new database"""
+    op.create_table('book',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.Column('author', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('format', sa.String(length=20), nullable=False),
+    sa.Column('rating', sa.Integer(), server_default=sa.text('0'), nullable=True),
+    sa.Column('category', sa.TEXT(), server_default=sa.text("'General'"), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('book_genre',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'genre_id')
+    )
+
+
 def upgrade():
+    # Databases created before Flask-Migrate already have these tables
+    if not sa.inspect(op.get_bind()).has_table('book'):
+        create_base_tables()
+
     # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table('book', schema=None) as batch_op:
         batch_op.alter_column('category',
@@ -0,0 +1,103 @@
+"""Add PostgreSQL full-text and trigram search
+
+Revision ID: e6b1d4f8a2c7
+Revises: d2a7c5e8f413
+Create Date: 2026-10-17 16:48:22.907133
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b1d4f8a2c7'
+down_revision = 'd2a7c5e8f413'
+branch_labels = None
+depends_on = None
+
+
+# Weighted document of one book: title A, author B, genres C, notes D
+DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION book_search_document(target_id integer) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(book.title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(book.author, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((
+               SELECT string_agg(genre.name, ' ') FROM genre
+               JOIN book_genre ON book_genre.genre_id = genre.id
+               WHERE book_genre.book_id = book.id), '')), 'C')
+        || setweight(to_tsvector('simple', coalesce(book.notes, '')), 'D')
+    FROM book WHERE book.id = target_id
+$$ LANGUAGE sql STABLE
+"""
+
+# One trigger function for book, book_genre and genre changes; skipped while
+# the bulk importer indexes a whole id range itself (search_index.bulk_insert)
+REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION book_search_refresh() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('shelflog.bulk_insert', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_TABLE_NAME = 'book' THEN
+        INSERT INTO book_search (book_id, document) VALUES (NEW.id, book_search_document(NEW.id))
+        ON CONFLICT (book_id) DO UPDATE SET document = excluded.document;
+    ELSIF TG_TABLE_NAME = 'book_genre' AND TG_OP = 'DELETE' THEN
+        UPDATE book_search SET document = book_search_document(book_id) WHERE book_id = OLD.book_id;
+    ELSIF TG_TABLE_NAME = 'book_genre' THEN
+        UPDATE book_search SET document = book_search_document(book_id) WHERE book_id = NEW.book_id;
+    ELSE
+        UPDATE book_search SET document = book_search_document(book_id)
+        WHERE book_id IN (SELECT book_id FROM book_genre WHERE genre_id = NEW.id);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGERS = {
+    'book_search_book': "AFTER INSERT OR UPDATE OF title, author, notes ON book",
+    'book_search_book_genre': "AFTER INSERT OR DELETE ON book_genre",
+    'book_search_genre': "AFTER UPDATE OF name ON genre",
+}
+
+# GIN trigram indexes serving the ILIKE '%q%' fallback searches
+TRIGRAM_INDEXES = {
+    'ix_book_title_trgm': 'title',
+    'ix_book_author_trgm': 'author',
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite uses the FTS5 index from a3c1e5f2b7d4
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in TRIGRAM_INDEXES.items():
+        op.execute(f"CREATE INDEX {name} ON book USING gin ({column} gin_trgm_ops)")
+
+    op.execute(
+        "CREATE TABLE book_search ("
+        "book_id integer PRIMARY KEY REFERENCES book (id) ON DELETE CASCADE, "
+        "document tsvector NOT NULL)"
+    )
+    op.execute("CREATE INDEX ix_book_search_document ON book_search USING gin (document)")
+    op.execute(DOCUMENT_FUNCTION)
+    op.execute(REFRESH_FUNCTION)
+    for name, event in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {event} FOR EACH ROW EXECUTE FUNCTION book_search_refresh()")
+
+    # Backfill existing books
+    op.execute("INSERT INTO book_search (book_id, document) SELECT id, book_search_document(id) FROM book")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, event in TRIGGERS.items():
+        table = event.rsplit(' ', 1)[-1]
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS book_search_refresh()")
+    op.execute("DROP TABLE IF EXISTS book_search")
+    op.execute("DROP FUNCTION IF EXISTS book_search_document(integer)")
+    for name in TRIGRAM_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,167 @@
+from flask_sqlalchemy import SQLAlchemy
+
+from database import RoutingSession
+
+# Shared SQLAlchemy handle, bound to the Flask app in app.py via database.init_app()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# --- THE MODEL (Data Structure) ---
+# Association table for many-to-many relationship between Book and Genre
+book_genre = db.Table('book_genre',
+    db.Column('book_id', db.Integer, db.ForeignKey('book.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    # The primary key serves book -> genres; this serves the genre filter
+    db.Index('ix_book_genre_genre_id', 'genre_id', 'book_id')
+)
+
+class Genre(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+
+# Whole percent of total_pages read, 0-100, computed by the database on every
+# insert and update (migration a8d3f6c2e1b9_add_book_progress_pct)
+PROGRESS_PCT_SQL = (
+    "CASE WHEN total_pages > 0 AND pages_read >= total_pages THEN 100 "
+    "WHEN total_pages > 0 AND pages_read > 0 THEN pages_read * 100 / total_pages "
+    "ELSE 0 END"
+)
+
+class Book(db.Model):
+   id = db.Column(db.Integer, primary_key=True)
+   title = db.Column(db.String(100), nullable=False)
+   author = db.Column(db.String(100), nullable=False)
+   status = db.Column(db.String(20), default='To Read')
+   # New column for media type (Physical, E-Book, Audiobook)
+   format = db.Column(db.String(20), nullable=False, default='Physical')
+   # New columns for rating and category
+   rating = db.Column(db.Integer, default=0)  # 0-5 stars
+   # Additional features columns
+   total_pages = db.Column(db.Integer, default=0)  # Total pages in the book
+   pages_read = db.Column(db.Integer, default=0)  # Number of pages read
+   progress_pct = db.Column(db.Integer, db.Computed(PROGRESS_PCT_SQL))  # Read-only, see PROGRESS_PCT_SQL
+   notes = db.Column(db.Text, default='')  # Personal notes/reviews for the book
+   start_date = db.Column(db.Date)  # When the user started reading
+   finish_date = db.Column(db.Date, index=True)  # When the user finished reading
+   cover_image = db.Column(db.String(200), default='')  # URL or path to book cover
+   # Many-to-many relationship with genres. Loaded lazily by default; routes
+   # that render genres ask for selectinload() explicitly (see listing_spec.py)
+   genres = db.relationship('Genre', secondary=book_genre, lazy='select',
+                            backref=db.backref('books', lazy=True))
+   # Short prefix of notes for list views, populated with with_expression()
+   notes_preview = db.query_expression()
+
+   # Indexes serving every filter/sort combination of the library listing
+   # (checked by 'flask plans check', see query_plans.py)
+   __table_args__ = (
+       db.Index('ix_book_title', 'title'),
+       db.Index('ix_book_author', 'author'),
+       db.Index('ix_book_rating', 'rating'),
+       db.Index('ix_book_status', 'status'),
+       db.Index('ix_book_format_title', 'format', 'title'),
+       db.Index('ix_book_format_author', 'format', 'author'),
+       db.Index('ix_book_format_rating', 'format', 'rating'),
+       db.Index('ix_book_format_status', 'format', 'status'),
+       db.Index('ix_book_rating_title', 'rating', 'title'),
+       db.Index('ix_book_rating_author', 'rating', 'author'),
+       db.Index('ix_book_rating_status', 'rating', 'status'),
+       db.Index('ix_book_progress_pct', 'progress_pct'),
+   )
+
+# --- MATERIALIZED STATISTICS ---
+# Summary tables maintained with write-time deltas (see library_stats.py)
+class LibraryStats(db.Model):
+    __tablename__ = 'library_stats'
+    id = db.Column(db.Integer, primary_key=True)  # Single row, id = 1
+    total_books = db.Column(db.Integer, nullable=False, default=0)
+    finished = db.Column(db.Integer, nullable=False, default=0)
+    reading = db.Column(db.Integer, nullable=False, default=0)
+    to_read = db.Column(db.Integer, nullable=False, default=0)
+    physical_count = db.Column(db.Integer, nullable=False, default=0)
+    ebook_count = db.Column(db.Integer, nullable=False, default=0)
+    audiobook_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    high_rated = db.Column(db.Integer, nullable=False, default=0)
+    total_pages_read = db.Column(db.Integer, nullable=False, default=0)
+    total_pages = db.Column(db.Integer, nullable=False, default=0)  # Only books with total_pages > 0
+    books_with_pages = db.Column(db.Integer, nullable=False, default=0)
+    finished_dated = db.Column(db.Integer, nullable=False, default=0)  # Books with a finish_date
+    days_to_complete_sum = db.Column(db.Integer, nullable=False, default=0)
+    days_to_complete_count = db.Column(db.Integer, nullable=False, default=0)
+    # Finished books per weekday of finish_date (0 = Sunday, like strftime('%w'))
+    weekday_0 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_1 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_2 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_3 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_4 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_5 = db.Column(db.Integer, nullable=False, default=0)
+    weekday_6 = db.Column(db.Integer, nullable=False, default=0)
+
+class GenreStats(db.Model):
+    __tablename__ = 'genre_stats'
+    genre_id = db.Column(db.Integer, db.ForeignKey('genre.id'), primary_key=True)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+
+class MonthStats(db.Model):
+    __tablename__ = 'month_stats'
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM' of finish_date
+    finished = db.Column(db.Integer, nullable=False, default=0)
+
+# --- READING LOG ---
+# Append-only history of reading progress with daily and weekly rollups (see reading_log.py)
+class ReadingEvent(db.Model):
+    __tablename__ = 'reading_event'
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False, index=True)  # No foreign key: history outlives the book
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)  # Local date the rollups bucket by
+    pages_read = db.Column(db.Integer, nullable=False, default=0)  # pages_read after the change
+    pages_delta = db.Column(db.Integer, nullable=False, default=0)  # Negative for corrections
+    previous_status = db.Column(db.String(20))
+    status = db.Column(db.String(20))
+
+class ReadingDay(db.Model):
+    __tablename__ = 'reading_day'
+    day = db.Column(db.Date, primary_key=True)
+    events = db.Column(db.Integer, nullable=False, default=0)
+    pages = db.Column(db.Integer, nullable=False, default=0)  # Net pages_delta
+    books_started = db.Column(db.Integer, nullable=False, default=0)  # Net changes into 'Reading'
+    books_finished = db.Column(db.Integer, nullable=False, default=0)  # Net changes into 'Finished'
+
+class ReadingWeek(db.Model):
+    __tablename__ = 'reading_week'
+    week = db.Column(db.Date, primary_key=True)  # Monday of the week
+    events = db.Column(db.Integer, nullable=False, default=0)
+    pages = db.Column(db.Integer, nullable=False, default=0)
+    books_started = db.Column(db.Integer, nullable=False, default=0)
+    books_finished = db.Column(db.Integer, nullable=False, default=0)
+
+# --- BACKGROUND JOBS ---
+# Persistent work queue drained by the worker pool (see jobs.py)
+class Job(db.Model):
+    __tablename__ = 'job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Handler name, see jobs.HANDLERS
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # Items done
+    total = db.Column(db.Integer)  # Items to do, once known
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))  # host:pid:thread of the worker running the job
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed with progress; stale jobs are claimed again
+    finished_at = db.Column(db.DateTime)
+
+    # Serves the worker's "oldest claimable job" lookup
+    __table_args__ = (
+        db.Index('ix_job_status_id', 'status', 'id'),
+    )
+
+# --- CACHE INVALIDATION ---
+# Bumped in the same transaction as every change to the library (see http_cache.py)
+class LibraryVersion(db.Model):
+    __tablename__ = 'library_version'
+    id = db.Column(db.Integer, primary_key=True)  # Single row, id = 1
+    version = db.Column(db.Integer, nullable=False, default=1)
@@ -0,0 +1,106 @@
+"""
+SQL statement budgets per route.
+
+``count_statements()`` counts the statements a block of code sends to the
+database using SQLAlchemy's ``before_cursor_execute`` event. ``flask budget
+check`` requests every main route through the Flask test client and fails
+when one issues more statements than its budget, which is how N+1 loading
+regressions (a query per book or per genre) get caught. The budgets do not
+depend on library size, so run the check against a library with at least a
+few pages of books.
+"""
+
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+
+from models import db, Book
+
+# Maximum number of SQL statements per request, once per-process caches are warm
+ROUTE_BUDGETS = {
+    '/': 4,  # library version (facet cache key), count, page, genres (selectin)
+    '/books/more': 2,  # page, genres (selectin)
+    '/search?q=a': 2,  # library version (facet cache key), page
+    '/dashboard': 6,  # summary row, months, genres, rolling windows, reading days and weeks
+    '/export': 2,  # books, genres (selectin)
+    '/update/{book_id}': 2,  # book, genres (selectin)
+}
+
+budget_cli = AppGroup('budget', help='Check SQL statement budgets per route.')
+
+
+class StatementCounter:
+    """Collects the SQL statements executed while it is active"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_statements(engine=None):
+    """Count SQL statements executed on ``engine`` (default: every engine, replica included) inside the block"""
+    engines = [engine] if engine is not None else list(db.engines.values())
+    counter = StatementCounter()
+    for listened in engines:
+        event.listen(listened, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        for listened in engines:
+            event.remove(listened, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+def check_budgets(app):
+    """Request every budgeted route twice and measure the second (warm) request.
+
+    Returns a list of (url, count, budget, statements) tuples.
+    """
+    first_book = db.session.query(Book.id).order_by(Book.id).first()
+    db.session.remove()
+    client = app.test_client()
+    results = []
+    # Measure the views themselves, not the response cache
+    view_cache, app.config['VIEW_CACHE'] = app.config['VIEW_CACHE'], False
+    try:
+        for route, budget in ROUTE_BUDGETS.items():
+            if '{book_id}' in route and first_book is None:
+                continue
+            url = route.format(book_id=first_book.id if first_book else 0)
+            client.get(url)  # Warm per-process caches (FTS and summary table checks)
+            with count_statements() as counter:
+                client.get(url)
+            results.append((url, counter.count, budget, counter.statements))
+    finally:
+        app.config['VIEW_CACHE'] = view_cache
+    return results
+
+
+@budget_cli.command('check')
+@click.option('--verbose', is_flag=True, help='Print the statements of every route.')
+def check_command(verbose):
+    """Fail if any route issues more SQL statements than its budget."""
+    books = db.session.query(db.func.count(Book.id)).scalar()
+    if books < 13:
+        click.echo(f'Note: only {books} books in the library; N+1 problems show up beyond one page (12).')
+
+    over_budget = 0
+    for url, count, budget, statements in check_budgets(current_app._get_current_object()):
+        ok = count <= budget
+        over_budget += not ok
+        click.echo(f"{'ok  ' if ok else 'FAIL'} {url}: {count} statement(s), budget {budget}")
+        if verbose or not ok:
+            for statement in statements:
+                click.echo('    ' + ' '.join(statement.split())[:160])
+
+    if over_budget:
+        raise click.ClickException(f'{over_budget} route(s) over their SQL statement budget.')
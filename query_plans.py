@@ -0,0 +1,90 @@
+"""
+Query-plan regression checks for the library listing.
+
+Runs ``EXPLAIN QUERY PLAN`` for every genre/rating/format filter combination
+``index()`` can produce, in every sort key and direction, and reports the
+ones SQLite would answer with a full table scan followed by a temporary
+B-tree sort. Run with ``flask plans check``; it exits non-zero on failure so
+it can gate a deployment.
+"""
+
+import itertools
+
+import click
+from flask.cli import AppGroup
+
+from models import db
+from listing_spec import Listing, SORT_KEYS, SORT_ORDERS
+
+# Representative filter values; the plan does not depend on the actual value
+GENRE_FILTERS = ('', 'Fantasy')
+RATING_FILTERS = ('', '5')
+FORMAT_FILTERS = ('', 'Physical')
+PROGRESS_FILTERS = (('', ''), ('90', '99'))
+
+# One page of the listing, as issued by index()
+PAGE_SIZE = 12
+
+plans_cli = AppGroup('plans', help='Inspect query plans of the library listing.')
+
+
+def listing_permutations():
+    """Yield every (genre, rating, format, progress range, sort, order) combination of index()"""
+    return itertools.product(GENRE_FILTERS, RATING_FILTERS, FORMAT_FILTERS, PROGRESS_FILTERS,
+                             SORT_KEYS, SORT_ORDERS)
+
+
+def explain(statement):
+    """Return the EXPLAIN QUERY PLAN detail lines for a select with its parameters bound"""
+    statement = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}')
+    return [row[3] for row in rows]
+
+
+def is_full_scan_sort(plan):
+    """True when the plan scans book without an index and sorts in a temp B-tree"""
+    full_scan = any(step.startswith('SCAN book') and 'INDEX' not in step for step in plan)
+    temp_sort = any('USE TEMP B-TREE FOR ORDER BY' in step for step in plan)
+    return full_scan and temp_sort
+
+
+def check_listing_plans():
+    """Explain every listing permutation.
+
+    Returns a list of (params, plan, ok) tuples, one per permutation.
+    """
+    results = []
+    for params in listing_permutations():
+        genre, rating, fmt, (progress_min, progress_max), sort_by, sort_order = params
+        filters = {'genre': genre, 'rating': rating, 'format': fmt,
+                   'progress_min': progress_min, 'progress_max': progress_max}
+        listing = Listing(filters=filters, sort=sort_by, order=sort_order)
+        statement = listing.statement('page')
+        plan = explain(statement.params(listing.params(listing_limit=PAGE_SIZE, listing_offset=0)))
+        results.append((params, plan, not is_full_scan_sort(plan)))
+    return results
+
+
+def _describe(params):
+    genre, rating, fmt, (progress_min, progress_max), sort_by, sort_order = params
+    progress = f'{progress_min}-{progress_max}' if progress_min or progress_max else '*'
+    return (f"genre={genre or '*'} rating={rating or '*'} format={fmt or '*'} progress={progress} "
+            f"sort={sort_by} {sort_order}")
+
+
+@plans_cli.command('check')
+@click.option('--verbose', is_flag=True, help='Print the plan of every permutation.')
+def check_command(verbose):
+    """Fail if any listing query falls back to a full scan plus sort."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Query-plan checks are only implemented for SQLite.')
+
+    results = check_listing_plans()
+    failures = [result for result in results if not result[2]]
+    for params, plan, ok in results:
+        if verbose or not ok:
+            click.echo(f"{'ok  ' if ok else 'FAIL'} {_describe(params)}: {' | '.join(plan)}")
+
+    if failures:
+        raise click.ClickException(f'{len(failures)} of {len(results)} listing queries need a full scan and sort.')
+    click.echo(f'All {len(results)} listing queries avoid a full scan plus sort.')
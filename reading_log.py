@@ -0,0 +1,271 @@
+"""
+Reading-session log and its time-bucketed rollups.
+
+``update_book`` reports every change to a book's ``pages_read`` or
+``status`` through ``record_change()``, which queues a ``reading_event``
+row on the session. The queue is written when the session commits: one
+multi-row INSERT for the events and one upsert per rollup table that adds
+the batch's per-day and per-week totals to ``reading_day`` and
+``reading_week``. This happens inside the same transaction as the book
+change, so the log and its rollups commit or roll back together with it.
+
+The rollups keep net values: a correction that lowers ``pages_read`` logs
+a negative ``pages_delta``, and moving a book out of 'Finished' takes it
+off that day's ``books_finished`` again.
+
+``activity_stats()`` feeds the dashboard's reading activity panel and
+reads only the rollups: the daily rows of the last ACTIVITY_DAYS days and
+the weekly rows of the last CHART_WEEKS weeks. That is a bounded number of
+tiny rows however long the history grows. ``flask reading rebuild``
+recomputes both rollup tables from the event log and reports any drift.
+"""
+
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, ReadingEvent, ReadingDay, ReadingWeek
+import database
+import http_cache
+
+# Days of daily rollups read for streaks, recent pages and the preferred weekday
+ACTIVITY_DAYS = 365
+# Window of the recent pages and pages-per-day figures
+RECENT_DAYS = 30
+# Weeks shown in the dashboard's pages-per-week chart
+CHART_WEEKS = 12
+
+# Session.info key of the events waiting for the commit
+PENDING_KEY = 'reading_events'
+
+ROLLUP_COLUMNS = ('events', 'pages', 'books_started', 'books_finished')
+# Statuses at or past each milestone: a change into one adds a book, a change back out removes it
+MILESTONES = {
+    'books_started': ('Reading', 'Finished'),
+    'books_finished': ('Finished',),
+}
+
+# Availability is checked once per engine (reading_event table present)
+_availability = {}
+
+reading_cli = AppGroup('reading', help='Manage the reading event log and its rollups.')
+
+
+def is_available():
+    """Return True when the reading log tables exist for the current engine"""
+    engine = db.engine
+    available = _availability.get(engine)
+    if available is None:
+        # Inspect on the session's connection (see library_stats.is_available)
+        available = inspect(db.session.connection()).has_table(ReadingEvent.__tablename__)
+        _availability[engine] = available
+    return available
+
+
+def week_of(day):
+    """Monday of the week ``day`` falls in (the reading_week key)"""
+    return day - timedelta(days=day.weekday())
+
+
+def record_change(book_id, before, after, now=None):
+    """Queue a reading event when pages_read or status changed between two snapshots.
+
+    ``before`` and ``after`` are library_stats.snapshot() dictionaries. The
+    event is written when the session commits (see _write_pending()).
+    """
+    pages_delta = after['pages_read'] - before['pages_read']
+    status_changed = after['status'] != before['status']
+    if not pages_delta and not status_changed:
+        return
+    now = now or datetime.now()
+    db.session.info.setdefault(PENDING_KEY, []).append({
+        'book_id': book_id,
+        'occurred_at': now,
+        'day': now.date(),
+        'pages_read': after['pages_read'],
+        'pages_delta': pages_delta,
+        'previous_status': before['status'] if status_changed else None,
+        'status': after['status'] if status_changed else None,
+    })
+
+
+def _contribution(row):
+    """Rollup counters of one event"""
+    counts = Counter(events=1, pages=row['pages_delta'])
+    if row['status'] is not None:
+        for column, statuses in MILESTONES.items():
+            counts[column] += (row['status'] in statuses) - (row['previous_status'] in statuses)
+    return counts
+
+
+def rollups(rows):
+    """Per-day and per-week counters of event rows: ({day: Counter}, {week: Counter})"""
+    days, weeks = {}, {}
+    for row in rows:
+        counts = _contribution(row)
+        days.setdefault(row['day'], Counter()).update(counts)
+        weeks.setdefault(week_of(row['day']), Counter()).update(counts)
+    return days, weeks
+
+
+def _upsert_rollup(session, model, key, buckets):
+    """Add each bucket's counters to its row, inserting missing rows (one executemany)"""
+    rows = [{key: bucket, **{column: counts[column] for column in ROLLUP_COLUMNS}}
+            for bucket, counts in buckets.items()]
+    if not rows:
+        return
+    stmt = database.insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: getattr(model, column) + stmt.excluded[column] for column in ROLLUP_COLUMNS},
+    )
+    session.execute(stmt, rows)
+
+
+def _write_pending(session):
+    rows = session.info.pop(PENDING_KEY, None)
+    if not rows or not is_available():
+        return
+    session.execute(db.insert(ReadingEvent), rows)
+    days, weeks = rollups(rows)
+    _upsert_rollup(session, ReadingDay, 'day', days)
+    _upsert_rollup(session, ReadingWeek, 'week', weeks)
+
+
+# --- BATCHED WRITES (ORM events) ---
+
+@event.listens_for(Session, 'before_commit')
+def _flush_reading_events(session):
+    if session.info.get(PENDING_KEY):
+        _write_pending(session)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_events(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+
+
+# --- ANALYTICS ---
+
+def _streak(active_days, today):
+    """Consecutive days with reading up to today (or yesterday, if today has none yet)"""
+    day = today if today in active_days else today - timedelta(days=1)
+    streak = 0
+    while day in active_days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+def activity_stats(today=None):
+    """Reading activity values of the dashboard, read from the rollup tables only"""
+    today = today or date.today()
+    stats = {
+        'reading_streak': 0,
+        'reading_days_last_30_days': 0,
+        'pages_last_30_days': 0,
+        'pages_per_day': 0,
+        'preferred_reading_weekday': 'N/A',
+        'weekly_pages_labels': [],
+        'weekly_pages': [],
+    }
+    if not is_available():
+        return stats
+
+    days = (db.session.query(ReadingDay.day, ReadingDay.pages)
+            .filter(ReadingDay.day > today - timedelta(days=ACTIVITY_DAYS), ReadingDay.events > 0)
+            .all())
+    recent_cutoff = today - timedelta(days=RECENT_DAYS)
+    recent = [(day, pages) for day, pages in days if day > recent_cutoff]
+    weekdays = Counter()
+    for day, pages in days:
+        weekdays[day.strftime('%A')] += max(pages, 0)
+
+    first_week = week_of(today) - timedelta(weeks=CHART_WEEKS - 1)
+    weeks = dict(db.session.query(ReadingWeek.week, ReadingWeek.pages)
+                 .filter(ReadingWeek.week >= first_week).all())
+    chart_weeks = [first_week + timedelta(weeks=offset) for offset in range(CHART_WEEKS)]
+
+    pages_recent = sum(pages for _, pages in recent)
+    stats.update(
+        reading_streak=_streak({day for day, _ in days}, today),
+        reading_days_last_30_days=len(recent),
+        pages_last_30_days=pages_recent,
+        pages_per_day=round(pages_recent / RECENT_DAYS, 1),
+        weekly_pages_labels=[week.strftime('%b %d') for week in chart_weeks],
+        weekly_pages=[weeks.get(week, 0) for week in chart_weeks],
+    )
+    if weekdays and max(weekdays.values()) > 0:
+        stats['preferred_reading_weekday'] = max(weekdays, key=weekdays.get)
+    return stats
+
+
+# --- REBUILD ---
+
+def _fresh_rollups():
+    """Rollup rows recomputed from the event log: ({day: Counter}, {week: Counter})"""
+    milestones = [
+        db.func.sum(db.case((ReadingEvent.status.in_(statuses), 1), else_=0))
+        - db.func.sum(db.case((ReadingEvent.previous_status.in_(statuses), 1), else_=0))
+        for statuses in MILESTONES.values()
+    ]
+    rows = (db.session.query(ReadingEvent.day, db.func.count(ReadingEvent.id),
+                             db.func.sum(ReadingEvent.pages_delta), *milestones)
+            .group_by(ReadingEvent.day).all())
+    days, weeks = {}, {}
+    for day, *values in rows:
+        counts = Counter(dict(zip(ROLLUP_COLUMNS, (value or 0 for value in values))))
+        days[day] = counts
+        weeks.setdefault(week_of(day), Counter()).update(counts)
+    return days, weeks
+
+
+def _stored_rollups():
+    days = {row.day: Counter({column: getattr(row, column) for column in ROLLUP_COLUMNS})
+            for row in db.session.query(ReadingDay).all()}
+    weeks = {row.week: Counter({column: getattr(row, column) for column in ROLLUP_COLUMNS})
+             for row in db.session.query(ReadingWeek).all()}
+    return days, weeks
+
+
+def _drift(stored, fresh):
+    """Human-readable differences between stored and recomputed rollups"""
+    problems = []
+    for table, stored_rows, fresh_rows in zip(('reading_day', 'reading_week'), stored, fresh):
+        for key in sorted(set(stored_rows) | set(fresh_rows)):
+            stored_values = {column: stored_rows.get(key, Counter())[column] for column in ROLLUP_COLUMNS}
+            fresh_values = {column: fresh_rows.get(key, Counter())[column] for column in ROLLUP_COLUMNS}
+            if stored_values != fresh_values:
+                problems.append(f'{table} {key}: stored {stored_values}, actual {fresh_values}')
+    return problems
+
+
+def rebuild_rollups():
+    """Replace both rollup tables with values recomputed from reading_event; returns the drift found"""
+    fresh = _fresh_rollups()
+    problems = _drift(_stored_rollups(), fresh)
+    days, weeks = fresh
+    db.session.query(ReadingDay).delete()
+    db.session.query(ReadingWeek).delete()
+    db.session.add_all(ReadingDay(day=day, **counts) for day, counts in days.items())
+    db.session.add_all(ReadingWeek(week=week, **counts) for week, counts in weeks.items())
+    http_cache.bump_version()  # Cached dashboards show the old figures
+    db.session.commit()
+    return problems
+
+
+@reading_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the daily and weekly rollups from the event log."""
+    if not is_available():
+        raise click.ClickException('Reading log tables not found; run "flask db upgrade" first.')
+
+    problems = rebuild_rollups()
+    for problem in problems:
+        click.echo(f'Drift: {problem}')
+    events = db.session.query(db.func.count(ReadingEvent.id)).scalar()
+    click.echo(f'Rebuilt rollups from {events} event(s) ({len(problems)} drifted row(s) corrected).')
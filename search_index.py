@@ -0,0 +1,264 @@
+"""
+Full-text search for the library.
+
+On SQLite the ``book_fts`` FTS5 virtual table is created by the
+``a3c1e5f2b7d4_add_book_full_text_search`` migration and mirrors each book's
+title, author, notes and genre names (rowid == book.id). Triggers on ``book``,
+``book_genre`` and ``genre`` keep it in sync, so the routes only ever read it.
+Bulk inserts use ``bulk_insert()``, which swaps the per-row insert triggers
+for one set-based index statement.
+
+On PostgreSQL the ``e6b1d4f8a2c7_add_postgres_search`` migration creates the
+``book_search`` table instead: one weighted ``tsvector`` per book (title A,
+author B, genres C, notes D) behind a GIN index, maintained by the same set of
+triggers. Matches are ranked with ``ts_rank_cd``. During ``bulk_insert()`` the
+triggers skip their work for the current transaction (``shelflog.bulk_insert``
+setting), so no table lock is needed.
+
+When no index is available (SQLite built without FTS5, or the migration has
+not been applied yet) searches fall back to the original ``LIKE '%q%'``
+filter on title and author; on PostgreSQL that is an ``ILIKE`` served by the
+``pg_trgm`` indexes on those columns.
+"""
+
+import re
+from contextlib import contextmanager
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from models import db, Book
+
+FTS_TABLE = 'book_fts'
+# PostgreSQL tsvector table and the text search configuration it was built with
+PG_SEARCH_TABLE = 'book_search'
+PG_TS_CONFIG = 'simple'
+# ts_rank_cd() weights of the D, C, B and A labels: notes, genres, author, title
+PG_RANK_WEIGHTS = (0.1, 0.2, 0.5, 1.0)
+# Transaction-local setting that makes the PostgreSQL search triggers skip a row
+PG_BULK_SETTING = 'shelflog.bulk_insert'
+
+# Bound parameter carrying the search value (see search_terms())
+SEARCH_PARAM = 'search_terms'
+
+# bm25() column weights: title, author, notes, genres
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+# Expression that renders all genre names of one book as a single string
+GENRES_FOR_BOOK_SQL = (
+    "SELECT coalesce(group_concat(genre.name, ' '), '') FROM genre "
+    "JOIN book_genre ON book_genre.genre_id = genre.id "
+    "WHERE book_genre.book_id = {book_id}"
+)
+
+# Per-row insert triggers that bulk_insert() suspends
+INSERT_TRIGGERS = ('book_fts_ai', 'book_genre_fts_ai')
+
+# Index kind per engine: 'fts5', 'tsvector' or None (checked once)
+_availability = {}
+
+search_cli = AppGroup('search', help='Manage the full-text search index.')
+
+
+def index_kind():
+    """'fts5' (SQLite), 'tsvector' (PostgreSQL) or None when no index exists"""
+    engine = db.engine
+    if engine not in _availability:
+        tables = {'sqlite': (FTS_TABLE, 'fts5'), 'postgresql': (PG_SEARCH_TABLE, 'tsvector')}
+        table, kind = tables.get(engine.dialect.name, (None, None))
+        present = table is not None and inspect(db.session.connection()).has_table(table)
+        _availability[engine] = kind if present else None
+    return _availability[engine]
+
+
+def is_available():
+    """Return True when a full-text index can be used for the current engine"""
+    return index_kind() is not None
+
+
+def build_match_expression(search_query):
+    """Turn free text into an FTS5 MATCH expression with prefix matching.
+
+    Every whitespace-separated term becomes a quoted prefix token, so
+    ``tolk lord`` matches "Tolkien - The Lord of the Rings". Terms are
+    AND-ed together. Returns None if nothing searchable is left.
+    """
+    terms = [term for term in re.split(r'\s+', search_query.strip()) if re.search(r'\w', term)]
+    if not terms:
+        return None
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def build_tsquery(search_query):
+    """Turn free text into a PostgreSQL tsquery with prefix matching (``tolk:* & lord:*``)"""
+    terms = re.findall(r'\w+', search_query)
+    if not terms:
+        return None
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def like_filter(term):
+    """Fallback filter used when the full-text index is unavailable"""
+    if db.engine.dialect.name == 'postgresql':
+        # Case-insensitive like SQLite's LIKE, and served by the pg_trgm indexes
+        return Book.title.icontains(term) | Book.author.icontains(term)
+    return Book.title.contains(term) | Book.author.contains(term)
+
+
+def _apply_tsvector_search(query, term, rank):
+    search_table = db.table(PG_SEARCH_TABLE, db.column('book_id', db.Integer), db.column('document'))
+    ts_query = db.func.to_tsquery(PG_TS_CONFIG, term)
+    query = (query.join(search_table, search_table.c.book_id == Book.id)
+             .filter(search_table.c.document.op('@@')(ts_query)))
+    if rank:
+        weights = db.literal_column("'{%s}'::float4[]" % ', '.join(str(weight) for weight in PG_RANK_WEIGHTS))
+        query = query.order_by(db.func.ts_rank_cd(weights, search_table.c.document, ts_query).desc(), Book.id.asc())
+    return query
+
+
+def search_terms(search_query):
+    """How ``search_query`` runs on the current database: (mode, value).
+
+    ``mode`` is 'fts5', 'tsvector' or 'like' (no index, or nothing the index
+    can search for) and ``value`` is what SEARCH_PARAM is bound to: the
+    MATCH expression, the tsquery or the raw text.
+    """
+    kind = index_kind()
+    if kind == 'tsvector':
+        tsquery = build_tsquery(search_query)
+        if tsquery is not None:
+            return 'tsvector', tsquery
+    elif kind == 'fts5':
+        match = build_match_expression(search_query)
+        if match is not None:
+            return 'fts5', match
+    return 'like', search_query
+
+
+def apply_search_mode(query, mode, rank=False):
+    """Restrict a Book query or select to search matches, leaving SEARCH_PARAM unbound.
+
+    The result only depends on ``mode`` and ``rank``, so it can be built
+    once and reused with any search value (see listing_spec.py). With
+    ``rank=True`` results are ordered by relevance (best match first);
+    otherwise ordering is left to the caller.
+    """
+    term = db.bindparam(SEARCH_PARAM, type_=db.String)
+    if mode == 'tsvector':
+        return _apply_tsvector_search(query, term, rank)
+    if mode == 'like':
+        return query.filter(like_filter(term))
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    matches = text(
+        f"SELECT rowid AS book_id, bm25({FTS_TABLE}, {weights}) AS score "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :{SEARCH_PARAM}"
+    ).bindparams(term).columns(book_id=db.Integer, score=db.Float).subquery('fts_match')
+
+    query = query.join(matches, matches.c.book_id == Book.id)
+    if rank:
+        # bm25() returns lower (more negative) scores for better matches
+        query = query.order_by(matches.c.score.asc(), Book.id.asc())
+    return query
+
+
+def apply_search(query, search_query, rank=False):
+    """Restrict a Book query to rows matching ``search_query``.
+
+    Uses the full-text index when available. With ``rank=True`` results are
+    ordered by relevance (best match first); otherwise ordering is left to
+    the caller.
+    """
+    mode, value = search_terms(search_query)
+    return apply_search_mode(query, mode, rank).params({SEARCH_PARAM: value})
+
+
+@contextmanager
+def bulk_insert():
+    """Index books inserted inside the block with one statement instead of per-row triggers.
+
+    Yields a list to which the caller appends the ids of the new books. On
+    SQLite the insert triggers are dropped and recreated on the session's
+    connection inside an explicit transaction (pysqlite would otherwise
+    autocommit the DDL), so a rollback restores them; they are also recreated
+    when the block raises. On PostgreSQL a transaction-local setting tells the
+    triggers to skip.
+    """
+    kind = index_kind()
+    if kind == 'tsvector':
+        yield from _bulk_insert_tsvector()
+        return
+    if kind is None:
+        yield []
+        return
+
+    connection = db.session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+    names = ', '.join(f"'{name}'" for name in INSERT_TRIGGERS)
+    triggers = connection.execute(text(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({names})"
+    )).all()
+    for name, _ in triggers:
+        connection.execute(text(f"DROP TRIGGER {name}"))
+
+    book_ids = []
+    try:
+        yield book_ids
+
+        if book_ids:
+            genres_sql = GENRES_FOR_BOOK_SQL.format(book_id='book.id')
+            connection.execute(text(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, author, notes, genres) "
+                f"SELECT book.id, book.title, book.author, coalesce(book.notes, ''), ({genres_sql}) "
+                f"FROM book WHERE book.id BETWEEN :first AND :last"
+            ), {'first': min(book_ids), 'last': max(book_ids)})
+    finally:
+        for _, sql in triggers:
+            connection.execute(text(sql))
+
+
+def _bulk_insert_tsvector():
+    connection = db.session.connection()
+    connection.execute(text(f"SELECT set_config('{PG_BULK_SETTING}', 'on', true)"))
+    book_ids = []
+    yield book_ids
+
+    connection.execute(text(f"SELECT set_config('{PG_BULK_SETTING}', 'off', true)"))
+    if book_ids:
+        connection.execute(text(
+            f"INSERT INTO {PG_SEARCH_TABLE} (book_id, document) "
+            f"SELECT id, book_search_document(id) FROM book WHERE id BETWEEN :first AND :last "
+            f"ON CONFLICT (book_id) DO UPDATE SET document = excluded.document"
+        ), {'first': min(book_ids), 'last': max(book_ids)})
+
+
+def rebuild_index():
+    """Repopulate the full-text index from the book, genre and book_genre tables"""
+    if index_kind() == 'tsvector':
+        with db.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {PG_SEARCH_TABLE}"))
+            conn.execute(text(
+                f"INSERT INTO {PG_SEARCH_TABLE} (book_id, document) SELECT id, book_search_document(id) FROM book"
+            ))
+            return conn.execute(text(f"SELECT count(*) FROM {PG_SEARCH_TABLE}")).scalar()
+
+    genres_sql = GENRES_FOR_BOOK_SQL.format(book_id='book.id')
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, author, notes, genres) "
+            f"SELECT book.id, book.title, book.author, coalesce(book.notes, ''), ({genres_sql}) FROM book"
+        ))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"))
+        return conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the full-text search index from scratch."""
+    if not is_available():
+        raise click.ClickException('Full-text index not available; run "flask db upgrade" first.')
+    indexed = rebuild_index()
+    click.echo(f'Indexed {indexed} books.')